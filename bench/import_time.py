@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# Import time benchmark for the clpy runtime path.
+# Fails (exit 1) when importing goes over budget, or pulls in the generator.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules the runtime path must never load.
+forbidden = ["clpy.__gen__", "argparse", "asyncio", "concurrent.futures", "tempfile"]
+
+def import_time(module, env):
+    # cumulative microseconds for the module, from -X importtime.
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, env=env, check=True).stderr
+    for line in out.splitlines():
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    return 0
+
+def loaded(module, env):
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True).stdout
+    return [m for m in forbidden if m in out.split()]
+
+def main():
+    parser = argparse.ArgumentParser(description="measure clpy import times against a budget.")
+    parser.add_argument("modules", nargs="*", default=["clpy", "clpy.__cli__"], help="modules to import, e.g. clpy.ls")
+    parser.add_argument("-n", "--runs", type=int, default=10, help="fresh interpreters per module")
+    parser.add_argument("-b", "--budget", type=float, default=50.0, help="budget per module in ms")
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([root, *os.environ.get("PYTHONPATH", "").split(os.pathsep)])}
+    # compile once so the runs measure importing, not byte compiling.
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    failed = False
+    for module in args.modules:
+        import_time(module, env)
+        times = [import_time(module, env) / 1000 for _ in range(args.runs)]
+        median = statistics.median(times)
+        bad = loaded(module, env)
+        over = median > args.budget
+        failed = failed or over or bool(bad)
+        print(f"{module:<24}median {median:7.2f}ms  min {min(times):7.2f}ms  budget {args.budget:.0f}ms"
+              + ("  OVER BUDGET" if over else "") + (f"  loads {', '.join(bad)}" if bad else ""))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# Parser benchmark over captured --help and man outputs in bench/fixtures.
+# Runs offline, checks the option dicts against bench/golden, and reports
+# lines/sec, time per stage, peak memory and the bytes each parsed option
+# keeps alive per fixture.
+# Exits 1 if any fixture's output no longer matches its golden file.
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+benchdir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchdir))
+import clpy.__gen__ as gen
+
+# scan includes reading the lines and picking up flags as they stream past.
+stages = ["usage", "scan", "validate", "table"]
+phases = {"usage": "parse_usage", "scan": "scan_help", "validate": "validate_options"}
+
+def parse(help_text, timings, tree=None):
+    # the same steps generate() takes: the lines are streamed through
+    # parse_text like a --help probe's would be, with its phases timed.
+    def timed(stage, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            out = func(*args, **kwargs)
+            timings[stage] += time.perf_counter() - start
+            return out
+        return wrapper
+
+    originals = {stage: getattr(gen, name) for stage, name in phases.items()}
+    for stage, name in phases.items():
+        setattr(gen, name, timed(stage, originals[stage]))
+    start = time.perf_counter()
+    try:
+        usage, options, _, _ = gen.parse_text(iter(help_text), keep_lines=False)
+    finally:
+        for stage, name in phases.items():
+            setattr(gen, name, originals[stage])
+    positional, _, option_dict = timed("table", gen.option_table)(options)
+    timings["total"] += time.perf_counter() - start
+    if tree is not None: tree.extend([usage, options])
+    return {
+        "cmd": usage.cmd if usage else None,
+        "positional": [o.name for o in positional],
+        "options": option_dict
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the help parser against the fixture corpus.")
+    parser.add_argument("fixtures", nargs="*", help="fixture names, defaults to all of them")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="timed runs per fixture")
+    parser.add_argument("--update", action="store_true", help="rewrite the golden files from the current output")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(benchdir, "fixtures", "*.txt")))
+    if args.fixtures:
+        paths = [p for p in paths if os.path.basename(p)[:-4] in args.fixtures]
+
+    print(f"{'fixture':<16}{'lines':>7}{'lines/s':>12}" + "".join([f"{s+' ms':>12}" for s in stages]) + f"{'peak KiB':>10}{'B/option':>10}  golden")
+    failed = []
+    total_lines, total_time = 0, 0
+    for path in paths:
+        name = os.path.basename(path)[:-4]
+        with open(path) as f:
+            text = f.read().split("\n")
+
+        timings = dict.fromkeys([*stages, "total"], 0.0)
+        # the parser prints the odd warning, keep the table readable.
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(args.runs):
+                result = parse(list(text), timings)
+            lines = list(text)
+            tree = []
+            tracemalloc.start()
+            parse(lines, dict.fromkeys([*stages, "total"], 0.0), tree)
+            # what the parse tree holds on to, the text itself isn't counted.
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            per_option = retained / max(1, len(tree[1]))
+            del tree
+
+        golden_path = os.path.join(benchdir, "golden", name+".json")
+        result = json.loads(json.dumps(result))
+        if args.update:
+            os.makedirs(os.path.dirname(golden_path), exist_ok=True)
+            with open(golden_path, "w") as f:
+                json.dump(result, f, indent=1)
+                f.write("\n")
+            status = "updated"
+        elif not os.path.exists(golden_path):
+            status = "missing"
+            failed.append(name)
+        else:
+            with open(golden_path) as f:
+                status = "ok" if json.load(f) == result else "MISMATCH"
+            if status != "ok": failed.append(name)
+
+        elapsed = timings["total"] / args.runs
+        total_lines += len(text)
+        total_time += elapsed
+        print(f"{name:<16}{len(text):>7}{len(text)/elapsed:>12.0f}"
+              + "".join([f"{timings[s]/args.runs*1000:>12.2f}" for s in stages])
+              + f"{peak/1024:>10.0f}{per_option:>10.0f}  {status}")
+
+    if total_time:
+        print(f"{'total':<16}{total_lines:>7}{total_lines/total_time:>12.0f}")
+    if failed:
+        print(f"golden mismatch: {', '.join(failed)}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
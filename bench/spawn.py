@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# Spawn latency micro-benchmark, from a parent with a large rss.
+# Compares clpy's spawn strategies over the same command.
+import argparse
+import os
+import statistics
+import sys
+import time
+from enum import Enum
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import clpy.__cli__ as cli
+
+class flags(Enum):
+    pass
+
+class runner(cli.cli):
+    # a bare runner, so the benchmark doesn't need any generated modules.
+    def __init__(self, cmd):
+        super().__init__(cmd, {}, flags, [])
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="measure spawn latency per clpy spawn strategy.")
+    parser.add_argument("command", nargs="*", default=["true"], help="the command to spawn")
+    parser.add_argument("-n", "--runs", type=int, default=200, help="runs per strategy")
+    parser.add_argument("-m", "--rss", type=int, default=1024, help="MiB of memory the parent touches first")
+    args = parser.parse_args()
+
+    # touch every page so it's really resident, that's what makes fork slow.
+    ballast = bytearray(args.rss * 1024 * 1024)
+    for i in range(0, len(ballast), 4096): ballast[i] = 1
+
+    cmd = runner(args.command)
+    cmd.instrumented = True
+    for strategy in ["subprocess", "resolved", "posix_spawn"]:
+        cli.spawn_strategy = strategy
+        cmd.run()
+        spawn, wall = [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            stats = cmd.run().stats
+            wall.append(time.perf_counter() - start)
+            spawn.append(stats.spawn)
+        print(f"{strategy:<12} rss {args.rss}MiB  spawn p50 {statistics.median(spawn)*1e6:8.1f}us"
+              f"  p90 {statistics.quantiles(spawn, n=10)[-1]*1e6:8.1f}us  run p50 {statistics.median(wall)*1e6:8.1f}us")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,936 @@
+import collections
+import functools
+import io
+import locale
+import os
+import signal
 import subprocess
-from clpy import generate
+import sys
+import threading
+import time
+import weakref
+# anything heavier (asyncio, concurrent.futures, the generator...) is imported
+# where it's used, importing generated modules should stay cheap.
 
 silent = True
+# max number of arun() processes in flight per event loop.
+async_limit = 32
+__async_limits = weakref.WeakKeyDictionary()
+# how much of stderr stream() keeps around for error messages.
+stderr_limit = 64 * 1024
+# called with a stats for every run while there are any, see add_hook().
+hooks = []
+# "resolved": launch by the cached absolute path, so the child doesn't walk PATH.
+# "posix_spawn": resolved, and without close_fds so subprocess can use posix_spawn.
+# "subprocess": subprocess's defaults.
+spawn_strategy = "resolved"
+# seconds a stopped process group gets between SIGTERM and SIGKILL.
+kill_grace = 1.0
+
+def set_async_limit(limit, loop=None):
+    """
+    set the arun() concurrency limit for a loop, defaults to the running loop.
+    """
+    import asyncio
+    loop = loop if loop else asyncio.get_running_loop()
+    __async_limits[loop] = asyncio.Semaphore(limit)
+    pass
+
+def get_async_limit(loop=None):
+    import asyncio
+    loop = loop if loop else asyncio.get_running_loop()
+    if loop not in __async_limits:
+        __async_limits[loop] = asyncio.Semaphore(async_limit)
+    return __async_limits[loop]
+
+@functools.lru_cache(maxsize=1024)
+def __resolve(name, path):
+    import shutil
+    return shutil.which(name, path=path)
+
+def resolve(name):
+    """
+    the absolute path of a command, cached for as long as PATH doesn't change.
+    """
+    if os.sep in name: return name
+    return __resolve(name, os.environ.get("PATH", os.defpath))
+
+def spawn_options(args):
+    # extra Popen arguments for the spawn strategy.
+    if spawn_strategy == "subprocess": return {}
+    exe = resolve(args[0])
+    if not exe: return {}
+    if spawn_strategy == "posix_spawn": return {"executable": exe, "close_fds": False}
+    return {"executable": exe}
+
+def group_options(isolated, group=None):
+    # a process group of its own, so stop() reaches any grandchildren too.
+    # given a group, the child joins it, 0 starts a new one others can join.
+    if not isolated or not hasattr(os, "killpg"): return {}
+    if sys.version_info >= (3, 11): return {"process_group": group if group else 0}
+    if group is None: return {"start_new_session": True}
+    # a new session can't be joined from outside it, so older pythons join in the child.
+    return {"preexec_fn": functools.partial(os.setpgid, 0, group)}
+
+def signal_group(proc, sig):
+    # the child's whole group if it leads one, else just the child. False once they're gone.
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(proc.pid, sig)
+            return True
+        except (ProcessLookupError, PermissionError):
+            pass
+    if proc.returncode is not None: return False
+    try:
+        proc.send_signal(sig)
+        return True
+    except ProcessLookupError:
+        return False
+
+def stop(proc, grace=None):
+    """
+    sends SIGTERM to a process and its group, then SIGKILL to whatever is left
+    after grace seconds, kill_grace by default.
+    """
+    grace = kill_grace if grace is None else grace
+    end = time.monotonic() + grace
+    if signal_group(proc, signal.SIGTERM):
+        while time.monotonic() < end:
+            if isinstance(proc, subprocess.Popen): proc.poll()
+            if not signal_group(proc, 0): return
+            time.sleep(0.01)
+        signal_group(proc, signal.SIGKILL)
+    pass
+
+async def astop(proc, grace=None):
+    # stop() for asyncio processes, without blocking the loop.
+    import asyncio
+    grace = kill_grace if grace is None else grace
+    end = time.monotonic() + grace
+    if signal_group(proc, signal.SIGTERM):
+        while time.monotonic() < end:
+            if not signal_group(proc, 0): return
+            await asyncio.sleep(0.01)
+        signal_group(proc, signal.SIGKILL)
+    pass
+
+class cancellation:
+    """
+    cancels runs from any thread, pass it to them as cancel= then call cancel().
+    runs still going are stopped and raise timed_out, later ones stop right away.
+    """
+    def __init__(self):
+        self.cancelled = False
+        self.__watchdogs = set()
+        self.__lock = threading.Lock()
+        pass
+
+    def add(self, dog):
+        with self.__lock:
+            self.__watchdogs.add(dog)
+            cancelled = self.cancelled
+        if cancelled: dog.fire("cancelled")
+        pass
+
+    def discard(self, dog):
+        with self.__lock: self.__watchdogs.discard(dog)
+        pass
+
+    def cancel(self):
+        with self.__lock:
+            self.cancelled = True
+            dogs = list(self.__watchdogs)
+        for dog in dogs:
+            threading.Thread(target=dog.fire, args=("cancelled",), daemon=True).start()
+        pass
+
+class watchdog:
+    """
+    stops a process once timeout seconds pass or cancel is cancelled.
+    stopped is then "timeout" or "cancelled", otherwise it stays None.
+    """
+    def __init__(self, proc, timeout=None, cancel=None):
+        self.proc = proc
+        self.timeout = timeout
+        self.cancel = cancel
+        self.stopped = None
+        self.timer = None
+        self.__lock = threading.Lock()
+        pass
+
+    def fire(self, reason="timeout"):
+        with self.__lock:
+            if self.stopped: return
+            self.stopped = reason
+        self.kill()
+        pass
+
+    def kill(self):
+        stop(self.proc)
+        pass
+
+    def __enter__(self):
+        if self.timeout is not None:
+            self.timer = threading.Timer(self.timeout, self.fire)
+            self.timer.daemon = True
+            self.timer.start()
+        if self.cancel: self.cancel.add(self)
+        return self
+
+    def __exit__(self, *exc):
+        if self.cancel: self.cancel.discard(self)
+        if self.timer:
+            # a timer that already fired is left to finish killing the group.
+            self.timer.cancel()
+            self.timer.join()
+        pass
+
+class async_watchdog(watchdog):
+    """
+    watchdog for asyncio processes, used with async with. the deadline is the
+    loop's and firing, from any thread, only schedules astop() on the loop,
+    so a child slow to die never blocks it.
+    """
+    def __init__(self, proc, timeout=None, cancel=None):
+        import asyncio
+        super().__init__(proc, timeout, cancel)
+        self.loop = asyncio.get_running_loop()
+        self.handle = None
+        self.task = None
+        pass
+
+    def kill(self):
+        self.loop.call_soon_threadsafe(self.start_stop)
+        pass
+
+    def start_stop(self):
+        self.task = self.loop.create_task(astop(self.proc))
+        pass
+
+    async def __aenter__(self):
+        if self.timeout is not None:
+            self.handle = self.loop.call_later(self.timeout, self.fire)
+        if self.cancel: self.cancel.add(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        import asyncio
+        if self.cancel: self.cancel.discard(self)
+        if self.handle: self.handle.cancel()
+        # a fired one finishes killing the group first, without holding up the loop.
+        while self.stopped and not self.task:
+            await asyncio.sleep(0)
+        if self.task: await self.task
+        pass
+
+def arg_limit():
+    """
+    bytes of argv a child can be given, what's left of ARG_MAX after the environment.
+    """
+    try:
+        limit = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        limit = 128 * 1024
+    env = os.environb if hasattr(os, "environb") else os.environ
+    # each string costs its bytes, a nul and a pointer, like the kernel counts it.
+    used = sum([len(k) + len(v) + 2 + 8 for k, v in env.items()])
+    # the same headroom xargs leaves.
+    return limit - used - 2048
+
+def chunk_args(prefix, args, limit=None, max_args=None):
+    # splits args into lists that each fit in argv after prefix, and after no more than max_args.
+    limit = limit if limit else arg_limit()
+    base = sum([len(os.fsencode(a)) + 1 + 8 for a in prefix])
+    chunk, used = [], base
+    for a in args:
+        size = len(os.fsencode(a)) + 1 + 8
+        if chunk and (used + size > limit or (max_args and len(chunk) >= max_args)):
+            yield chunk
+            chunk, used = [], base
+        chunk.append(a)
+        used += size
+    # like xargs, no args still means one run.
+    if chunk or not args: yield chunk
+
+# flag enums compile_flags has done, kept out of the enums as any name could be a flag.
+compiled_flags = weakref.WeakSet()
+
+def compile_flags(flag_type, options):
+    # puts each flag's switch on its enum member, so building argv skips the option lookups.
+    if flag_type in compiled_flags: return
+    for f in flag_type:
+        option = options.get(f.name, {})
+        f.switch = option.get("switch")
+        f.wants_equals = option.get("wants_equals", False)
+    compiled_flags.add(flag_type)
+    pass
+
+@functools.lru_cache(maxsize=256)
+def __frozen(runner_type, in_flags):
+    return runner_type(*in_flags).freeze()
+
+def frozen(runner_type, *in_flags):
+    """
+    a shared frozen runner for a flag configuration, built once and reused.
+    """
+    try:
+        return __frozen(runner_type, in_flags)
+    except TypeError:
+        # unhashable flag values, can't be cached.
+        return runner_type(*in_flags).freeze()
+
+def decode(data, encoding=None, errors="strict"):
+    # matches what subprocess.run(text=True) hands back.
+    if data is None: return None
+    data = str(data, encoding if encoding else locale.getpreferredencoding(False), errors)
+    return data.replace("\r\n", "\n").replace("\r", "\n")
+
+def encode(text, encoding=None):
+    if text is None or isinstance(text, (bytes, bytearray, memoryview)): return text
+    return text.encode(encoding if encoding else locale.getpreferredencoding(False))
+
+class result(subprocess.CompletedProcess):
+    """
+    a CompletedProcess that keeps the raw output and only decodes it when read.
+    stdout_bytes and stderr_bytes are always the raw output, in raw mode so are
+    stdout and stderr.
+    stats is set when the run was instrumented.
+    decoder is the runner's default for records().
+    """
+    stats = None
+    decoder = None
+    def __init__(self, args, returncode, stdout=None, stderr=None, raw=False, encoding=None, errors="strict"):
+        self.args = args
+        self.returncode = returncode
+        self.stdout_bytes = stdout
+        self.stderr_bytes = stderr
+        self.raw = raw
+        self.encoding = encoding
+        self.errors = errors
+        self.__decoded = {}
+        pass
+
+    def __text(self, name, data):
+        if self.raw: return data
+        if name not in self.__decoded:
+            self.__decoded[name] = decode(data, self.encoding, self.errors)
+        return self.__decoded[name]
+
+    @property
+    def stdout(self):
+        return self.__text("stdout", self.stdout_bytes)
+
+    @property
+    def stderr(self):
+        return self.__text("stderr", self.stderr_bytes)
+
+    def stdout_view(self):
+        return memoryview(self.stdout_bytes)
+
+    def records(self, decoder=None):
+        """
+        stdout decoded record by record, by decoder or the runner's default.
+        """
+        decoder = get_decoder(decoder if decoder else self.decoder)
+        return decoder([self.stdout_bytes] if self.stdout_bytes else [], self.encoding, self.errors)
+
+class lines:
+    """
+    decodes output into lines, split on sep, without it unless keepends.
+    called with an iterable of bytes chunks, yields each line once it's complete.
+    splits before decoding, so the encoding has to be ascii compatible.
+    """
+    # bytes of whole lines decoded at once.
+    block = 64 * 1024
+    def __init__(self, sep="\n", keepends=False):
+        self.sep = sep
+        self.keepends = keepends
+        pass
+
+    def split(self, text):
+        parts = text.split(self.sep)
+        if self.keepends: return [p+self.sep for p in parts]
+        if self.sep == "\n" and "\r" in text:
+            return [p[:-1] if p.endswith("\r") else p for p in parts]
+        return parts
+
+    def __call__(self, chunks, encoding=None, errors="strict"):
+        encoding = encoding if encoding else locale.getpreferredencoding(False)
+        sep = self.sep.encode()
+        tail = b""
+        for chunk in chunks:
+            view = memoryview(chunk)
+            start = 0
+            while start < len(chunk):
+                # a block of whole lines at a time, memory is bounded by the block
+                # rather than the output, and only lines split across chunks are copied.
+                end = chunk.rfind(sep, start, start+self.block)
+                if end == -1: end = chunk.find(sep, start+self.block)
+                if end == -1: break
+                yield from self.split(str(tail + view[start:end] if tail else view[start:end], encoding, errors))
+                tail = b""
+                start = end + len(sep)
+            if start < len(chunk):
+                tail += view[start:]
+        if tail:
+            line = str(tail, encoding, errors)
+            yield line if self.sep != "\n" or self.keepends else line.removesuffix("\r")
+        pass
+
+class columns:
+    """
+    decodes whitespace aligned tables like ps or df into a dict per row.
+    names default to the header line's words, the last column keeps its spaces.
+    with widths, rows are cut into columns that many characters wide instead,
+    the last column being whatever is left.
+    without a header or names rows are lists.
+    """
+    def __init__(self, names=None, widths=None, header=True):
+        self.names = names
+        self.widths = widths
+        self.header = header
+        pass
+
+    def __call__(self, chunks, encoding=None, errors="strict"):
+        rows = lines()(chunks, encoding, errors)
+        names = self.names
+        if self.header:
+            head = next(rows, None)
+            if head is None: return
+            if not names: names = head.split()
+        cuts = None
+        if self.widths:
+            starts = [sum(self.widths[:i]) for i in range(len(self.widths)+1)]
+            cuts = [*zip(starts, [*starts[1:], None])]
+        for row in rows:
+            if not row.strip(): continue
+            if cuts:
+                fields = [row[a:b].strip() for a, b in cuts]
+            else:
+                fields = row.split(None, len(names)-1) if names else row.split()
+            yield dict(zip(names, fields)) if names else fields
+        pass
+
+class table:
+    """
+    decodes csv output, or any other delimiter, into a dict per row keyed on the
+    header, or lists without one.
+    """
+    def __init__(self, delimiter=",", header=True):
+        self.delimiter = delimiter
+        self.header = header
+        pass
+
+    def __call__(self, chunks, encoding=None, errors="strict"):
+        import csv
+        rows = csv.reader(lines(keepends=True)(chunks, encoding, errors), delimiter=self.delimiter)
+        if not self.header:
+            yield from rows
+            return
+        names = next(rows, None)
+        for row in rows:
+            yield dict(zip(names, row))
+        pass
+
+class json_lines:
+    """
+    decodes one json value per line, blank lines are skipped.
+    """
+    def __call__(self, chunks, encoding=None, errors="strict"):
+        import json
+        for line in lines()(chunks, encoding, errors):
+            if line.strip(): yield json.loads(line)
+        pass
+
+# decoders by name, for cli.decoder and generated modules.
+decoders = {
+    "lines": lines,
+    "nul": functools.partial(lines, "\0"),
+    "columns": columns,
+    "csv": table,
+    "tsv": functools.partial(table, "\t"),
+    "jsonl": json_lines
+}
+
+def get_decoder(decoder=None):
+    # a decoder, the name of one, or lines by default.
+    if decoder is None: return lines()
+    return decoders[decoder]() if isinstance(decoder, str) else decoder
+
+def drain(pipe, limit):
+    # keeps only the tail of a pipe so memory stays bounded.
+    tail = collections.deque()
+    size = 0
+    while chunk := pipe.read1(8192):
+        tail.append(chunk)
+        size += len(chunk)
+        while size - len(tail[0]) >= limit:
+            size -= len(tail.popleft())
+    pipe.close()
+    return b"".join(tail)[-limit:]
+
+def feed(pipe, data):
+    try:
+        pipe.write(data)
+        pipe.close()
+    except BrokenPipeError:
+        pass
+
+def error(cmd, returncode, stderr):
+    e = RuntimeError(f"Running '{' '.join(cmd)}' returned {returncode}"+"\n\n"+stderr)
+    e.cmd, e.returncode, e.stderr = cmd, returncode, stderr
+    return e
+
+class timed_out(RuntimeError):
+    """
+    a run that passed its deadline or was cancelled, its process group was killed.
+    partial is a result holding whatever the command wrote until then.
+    """
+    def __init__(self, cmd, timeout, partial, stopped="timeout"):
+        what = "was cancelled" if stopped == "cancelled" else f"timed out after {timeout}s"
+        # a pipeline's cmd is a list of stages.
+        text = " | ".join([" ".join(c) for c in cmd]) if cmd and not isinstance(cmd[0], str) else " ".join(cmd)
+        super().__init__(f"Running '{text}' {what}")
+        self.cmd = cmd
+        self.timeout = timeout
+        self.partial = partial
+        self.cancelled = stopped == "cancelled"
+        self.returncode = partial.returncode
+        pass
+
+    @property
+    def stdout(self):
+        return self.partial.stdout
+
+    @property
+    def stderr(self):
+        return self.partial.stderr
+
+class coworker:
+    """
+    a single long-lived child used by coprocess.
+    """
+    def __init__(self, args, sentinel):
+        self.args = args
+        self.sentinel = sentinel
+        self.encoding = locale.getpreferredencoding(False)
+        self.proc = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self.stderr = []
+        self.thread = threading.Thread(target=lambda: self.stderr.append(drain(self.proc.stderr, stderr_limit)), daemon=True)
+        self.thread.start()
+        pass
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def send(self, text, timeout=None):
+        request = text if text.endswith("\n") else text+"\n"
+        if self.sentinel:
+            request += self.sentinel[0] if self.sentinel[0].endswith("\n") else self.sentinel[0]+"\n"
+        out = []
+        # a reply that never comes (grep's non-matches, sort) would block forever,
+        # past timeout the worker is stopped and restarted on the next request.
+        with watchdog(self.proc, timeout) as dog:
+            try:
+                self.proc.stdin.write(request.encode(self.encoding))
+                self.proc.stdin.flush()
+                if not self.sentinel:
+                    if line := self.proc.stdout.readline():
+                        return decode(line).removesuffix("\n")
+                else:
+                    while line := self.proc.stdout.readline():
+                        if decode(line).removesuffix("\n") == self.sentinel[1]:
+                            return decode(b"".join(out))
+                        out.append(line)
+            except (BrokenPipeError, ValueError):
+                pass
+        self.close()
+        stderr = self.stderr[0] if self.stderr else b""
+        if dog.stopped:
+            raise timed_out(self.args, timeout, result(self.args, self.proc.returncode, b"".join(out), stderr))
+        raise error(self.args, self.proc.returncode, decode(stderr))
+
+    def close(self):
+        try:
+            # whatever's still buffered for a worker that's gone can't be sent.
+            self.proc.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+        if self.alive():
+            try:
+                self.proc.wait(1)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        self.thread.join(1)
+        self.proc.stdout.close()
+        pass
+
+class coprocess:
+    """
+    a pool of long-lived children for filter commands, fed over their pipes.
+    without a sentinel each request is one line in and one line out.
+    with sentinel=(send, expect) the sent text is followed by send, and the reply
+    is every line until one equal to expect.
+    tools that buffer their output when piped need their unbuffered flag set.
+    workers that die are restarted, the request that saw it fail raises RuntimeError.
+    a request with no reply after timeout seconds raises timed_out, and its
+    worker is stopped and restarted.
+    """
+    def __init__(self, args, workers=1, sentinel=None, timeout=None):
+        import queue
+        self.args = args
+        self.sentinel = sentinel
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.workers = []
+        for _ in range(workers):
+            self.idle.put(None)
+        pass
+
+    def send(self, text, timeout=None):
+        worker = self.idle.get()
+        try:
+            if not worker or not worker.alive():
+                if worker:
+                    worker.close()
+                    self.workers.remove(worker)
+                    # if the restart fails, the slot is left empty for the next send.
+                    worker = None
+                worker = coworker(self.args, self.sentinel)
+                self.workers.append(worker)
+            return worker.send(text, self.timeout if timeout is None else timeout)
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for w in self.workers: w.close()
+        self.workers = []
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        pass
+
+class result_cache:
+    """
+    caches successful results of idempotent commands.
+    entries are keyed on argv, pipetext, the mtimes of any input files and
+    optionally the environment and working directory.
+    the in-memory tier is an lru of up to size entries, each living ttl seconds.
+    given a path, entries are also stored in its clpy_results directory and
+    shared between processes, as a small header and the raw output, never
+    anything that's unpickled.
+    expired ones are removed when they're next read.
+    """
+    # magic, stored time, stdout and stderr lengths.
+    header = "<4sdQQ"
+    magic = b"clpy"
+
+    def __init__(self, size=256, ttl=None, path=None, env=False, cwd=False):
+        self.size = size
+        self.ttl = ttl
+        self.path = path
+        self.env = env
+        self.cwd = cwd
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.__entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        # a directory of its own, path may well be shared with other things.
+        self.dir = os.path.join(path, "clpy_results") if path else None
+        if path: os.makedirs(self.dir, exist_ok=True)
+        pass
+
+    def key(self, args, pipetext=None, files=()):
+        import hashlib
+        import pickle
+        key = [tuple(args), encode(pipetext)]
+        key.append(sorted(os.environ.items()) if self.env else None)
+        key.append(os.getcwd() if self.cwd else None)
+        for f in files:
+            try:
+                key.append((f, os.stat(f).st_mtime_ns))
+            except OSError:
+                key.append((f, None))
+        return hashlib.sha256(pickle.dumps(key)).hexdigest()
+
+    def expired(self, stored):
+        return self.ttl is not None and time.time() - stored > self.ttl
+
+    def read(self, key):
+        # the disk entry for key, None if there isn't a good one, removing expired ones.
+        import struct
+        path = os.path.join(self.dir, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        size = struct.calcsize(self.header)
+        if len(data) >= size:
+            magic, stored, out_len, err_len = struct.unpack_from(self.header, data)
+            if magic == self.magic and size+out_len+err_len == len(data):
+                if not self.expired(stored):
+                    return (stored, (data[size:size+out_len], data[size+out_len:]))
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    def get(self, key):
+        with self.__lock:
+            if entry := self.__entries.get(key):
+                if not self.expired(entry[0]):
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del(self.__entries[key])
+        if self.path and (entry := self.read(key)):
+            self.__put(key, entry)
+            with self.__lock: self.disk_hits += 1
+            return entry[1]
+        with self.__lock: self.misses += 1
+        return None
+
+    def __put(self, key, entry):
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.size:
+                self.__entries.popitem(last=False)
+        pass
+
+    def put(self, key, value):
+        import struct
+        import tempfile
+        entry = (time.time(), value)
+        self.__put(key, entry)
+        if self.path:
+            stdout, stderr = [v if v else b"" for v in value]
+            # written whole then renamed, so other processes never see half an entry.
+            fd, tmp = tempfile.mkstemp(dir=self.dir)
+            with os.fdopen(fd, "wb") as f:
+                f.write(struct.pack(self.header, self.magic, entry[0], len(stdout), len(stderr)))
+                f.write(stdout)
+                f.write(stderr)
+            os.replace(tmp, os.path.join(self.dir, key))
+        pass
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+        if self.path:
+            # only entries, named by their sha256 key.
+            for f in os.listdir(self.dir):
+                path = os.path.join(self.dir, f)
+                if len(f) == 64 and all(c in "0123456789abcdef" for c in f) and os.path.isfile(path):
+                    os.remove(path)
+        pass
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "size": len(self.__entries)}
+
+# the cache used by cacheable runners unless they're given their own.
+results = result_cache()
+
+class stats:
+    """
+    what one instrumented run cost.
+    spawn and wall are seconds, user and sys are the child's cpu seconds,
+    only known for run() as they come from wait4(), otherwise None.
+    there's no peak rss, on linux a child's ru_maxrss starts at its parent's,
+    fork copies the high-water mark and exec keeps it.
+    stdout_bytes is None for stream(), which hands output over as it comes.
+    """
+    def __init__(self, args, returncode, spawn, wall, rusage, stdin_bytes, stdout_bytes, stderr_bytes):
+        self.args = args
+        self.returncode = returncode
+        self.spawn = spawn
+        self.wall = wall
+        self.user = rusage.ru_utime if rusage else None
+        self.sys = rusage.ru_stime if rusage else None
+        self.stdin_bytes = stdin_bytes
+        self.stdout_bytes = stdout_bytes
+        self.stderr_bytes = stderr_bytes
+        pass
+
+    def __repr__(self):
+        return f"stats({', '.join([f'{k}={v!r}' for k, v in vars(self).items()])})"
+
+class rusage_popen(subprocess.Popen):
+    # reaps the child with wait4() so its resource usage isn't thrown away.
+    rusage = None
+    def _try_wait(self, wait_flags):
+        try:
+            (pid, sts, rusage) = os.wait4(self.pid, wait_flags)
+            if pid: self.rusage = rusage
+        except ChildProcessError:
+            pid = self.pid
+            sts = 0
+        return (pid, sts)
+
+def add_hook(hook):
+    """
+    hook(stats) is called after every run, arun, stream and pipeline stage
+    until it's removed.
+    """
+    hooks.append(hook)
+    return hook
+
+def remove_hook(hook):
+    if hook in hooks: hooks.remove(hook)
+    pass
+
+def report(*args):
+    # stats(*args), passed to the hooks.
+    info = stats(*args)
+    for hook in hooks: hook(info)
+    return info
+
+def run_watched(args, stdin=None, timeout=None, cancel=None, instrumented=False):
+    # Popen and communicate under a watchdog, and stats for the hooks if instrumented.
+    start = time.perf_counter()
+    popen = rusage_popen if instrumented and hasattr(os, "wait4") else subprocess.Popen
+    proc = popen(args, stdin=subprocess.PIPE if stdin is not None else None, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                 **spawn_options(args), **group_options(timeout is not None or cancel is not None))
+    spawned = time.perf_counter()
+    with watchdog(proc, timeout, cancel) as dog:
+        try:
+            stdout, stderr = proc.communicate(stdin)
+        except BaseException:
+            # like subprocess.run(), don't leave it running on KeyboardInterrupt.
+            stop(proc, 0)
+            proc.wait()
+            raise
+    end = time.perf_counter()
+    info = None
+    if instrumented:
+        info = report(args, proc.returncode, spawned-start, end-start, getattr(proc, "rusage", None),
+                      len(stdin) if stdin else 0, len(stdout), len(stderr))
+    return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr), info, dog.stopped
+
+class aggregator:
+    """
+    a hook that collects stats per command and reports percentiles.
+    keeps the last limit samples of each command.
+    """
+    fields = ["spawn", "wall", "user", "sys", "stdout_bytes"]
+
+    def __init__(self, limit=10000):
+        self.limit = limit
+        self.samples = {}
+        self.__lock = threading.Lock()
+        pass
+
+    def __call__(self, info):
+        with self.__lock:
+            if info.args[0] not in self.samples:
+                self.samples[info.args[0]] = collections.deque(maxlen=self.limit)
+            self.samples[info.args[0]].append(info)
+        pass
+
+    def report(self, percentiles=(50, 90, 99)):
+        """
+        {command: {"count": n, field: {percentile: value}}}
+        """
+        out = {}
+        with self.__lock:
+            samples = {k: list(v) for k, v in self.samples.items()}
+        for cmd, infos in samples.items():
+            out[cmd] = {"count": len(infos)}
+            for field in self.fields:
+                values = sorted([getattr(i, field) for i in infos if getattr(i, field) is not None])
+                if values:
+                    out[cmd][field] = {p: values[min(len(values)-1, len(values)*p//100)] for p in percentiles}
+        return out
+
+    def print_report(self, percentiles=(50, 90, 99)):
+        for cmd, report in self.report(percentiles).items():
+            print(f"{cmd} ({report['count']} runs)")
+            for field in self.fields:
+                if field in report:
+                    print("".ljust(4)+field.ljust(16)+"  ".join([f"p{p}: {v:.6g}" for p, v in report[field].items()]))
+        pass
+
+class pipeline:
+    """
+    runners connected with os pipes, built with runner | runner.
+    every stage runs at once and only the last stage's stdout comes back.
+    a failing stage raises RuntimeError naming that stage.
+    """
+    def __init__(self, *stages):
+        self.stages = [*stages]
+        pass
+
+    def __or__(self, other):
+        if isinstance(other, cli): other = other.pipe()
+        if not isinstance(other, pipeline): return NotImplemented
+        return pipeline(*self.stages, *other.stages)
+
+    def run(self, pipetext=None, raw=False, encoding=None, errors="strict", timeout=None, cancel=None):
+        """
+        runs every stage, with timeout or cancel all of them share one process group
+        and are stopped together.
+        """
+        procs = []
+        stdin = subprocess.PIPE if pipetext is not None else None
+        isolated = timeout is not None or cancel is not None
+        group = group_options(isolated, 0)
+        start = time.perf_counter()
+        for args in self.stages:
+            proc = subprocess.Popen(args, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **spawn_options(args), **group)
+            # the later stages join the first's group, so the watchdog stops them all.
+            group = group_options(isolated, procs[0].pid if procs else proc.pid)
+            if procs:
+                # the next stage owns the read end now.
+                procs[-1].stdout.close()
+            procs.append(proc)
+            stdin = proc.stdout
+        spawned = time.perf_counter()
+
+        stderrs = [[] for _ in procs]
+        threads = [threading.Thread(target=lambda p=p, e=e: e.append(drain(p.stderr, stderr_limit)), daemon=True)
+                   for p, e in zip(procs, stderrs)]
+        if pipetext is not None:
+            threads.append(threading.Thread(target=feed, args=(procs[0].stdin, encode(pipetext, encoding)), daemon=True))
+        for t in threads: t.start()
+        with watchdog(procs[0], timeout, cancel) as dog:
+            stdout = procs[-1].stdout.read()
+            procs[-1].stdout.close()
+            for p in procs: p.wait()
+            for t in threads: t.join()
+        stderrs = [e[0] if e else b"" for e in stderrs]
+        if hooks:
+            # a stats per stage, only the ends know their piped byte counts.
+            end = time.perf_counter()
+            for n, (args, proc, stderr) in enumerate(zip(self.stages, procs, stderrs)):
+                report(args, proc.returncode, spawned-start, end-start, None,
+                       len(encode(pipetext, encoding)) if n == 0 and pipetext is not None else 0,
+                       len(stdout) if proc == procs[-1] else None, len(stderr))
+        if dog.stopped:
+            raise timed_out(self.stages, timeout, result(self.stages, procs[-1].returncode, stdout, stderrs[-1], raw, encoding, errors), dog.stopped)
+
+        for n, (args, proc, stderr) in enumerate(zip(self.stages, procs, stderrs)):
+            # like a shell, earlier stages cut off by a closed pipe aren't errors.
+            if proc == procs[-1] or proc.returncode != -signal.SIGPIPE:
+                if proc.returncode:
+                    e = error(args, proc.returncode, decode(stderr, encoding, "replace"))
+                    e.args = (f"Pipeline stage {n}: "+e.args[0],)
+                    e.stage = n
+                    raise e
+        return result(self.stages, procs[-1].returncode, stdout, stderrs[-1], raw, encoding, errors)
 
 class cli:
     """
@@ -13,20 +942,42 @@ class cli:
     __cmd = ["echo"]
     __options = None
     __flag_type = None
+    __prefix = None
+    __frozen = False
+    # output handling, can be overridden per call.
+    raw = False
+    encoding = None
+    errors = "strict"
+    # result caching, cached=True on a call opts in for just that call.
+    cacheable = False
+    cache = None
+    # attach stats to results even without any hooks.
+    instrumented = False
+    # seconds a run may take before its process group is stopped, per call with timeout=.
+    timeout = None
+    # how records() splits output, a decoder or a name from decoders.
+    decoder = None
+    # where the module was generated from, "auto", "man" or "help", for regenerating it.
+    source = "auto"
     def __init__(self, cmd, options, flag_type, g_flags, *in_flags):
         self.__cmd = cmd
         self.__options = options
         self.__g_flags = g_flags
         self.__flag_type = flag_type
         self.__flags = dict()
+        compile_flags(flag_type, options)
         self.add_flags(*in_flags)
         pass
     
-    def __regenerate__(self):
-        generate(" ".join(self.__cmd), self.__g_flags)
+    def __regenerate__(self, update=True, force=False):
+        from clpy import generate
+        generate(" ".join(self.__cmd), self.__g_flags, cacheable=type(self).cacheable, decoder=type(self).decoder,
+                 update=update, force=force, source=type(self).source)
         pass
 
     def add_flags(self, *in_flags):
+        if self.__frozen: raise RuntimeError("Can't add flags to a frozen runner.")
+        self.__prefix = None
         for a in in_flags:
             if isinstance(a, self.__flag_type):
                 self.__flags[a] = a
@@ -41,32 +992,291 @@ class cli:
         pass
 
     def del_flags(self, *in_flags):
+        if self.__frozen: raise RuntimeError("Can't delete flags from a frozen runner.")
+        self.__prefix = None
         for a in in_flags:
             if a in self.__flags:
                 del(self.__flags[a])
         pass
 
-    def run(self, *in_args, pipetext=None):
+    def freeze(self):
+        """
+        locks the flags and compiles the argv prefix, so runs only pay for their args.
+        """
+        self.build_prefix()
+        self.__frozen = True
+        return self
+
+    def build_prefix(self):
+        # cached until add_flags/del_flags change the flags.
+        if self.__prefix is not None: return self.__prefix
         args = [*self.__cmd]
         args.extend(self.__g_flags)
-        for k in self.__flags:
-            val = self.__flags[k]
+        for k, val in self.__flags.items():
             if isinstance(val, tuple):
-                val = [str(v) for v in val]
-                join = "=" if self.__options[k.name]["wants_equals"] else ""
-                if join:
-                    args.append(self.__options[k.name]["switch"]+join+",".join(val))
+                val = ",".join([str(v) for v in val])
+                if k.wants_equals:
+                    args.append(k.switch+"="+val)
                 else:
-                    args.extend([self.__options[k.name]["switch"],join+",".join(val)])
+                    args.extend([k.switch, val])
             else:
-                args.append(self.__options[k.name]["switch"])
+                args.append(k.switch)
+        self.__prefix = tuple(args)
+        return self.__prefix
 
-        args.extend(in_args)
+    def build_args(self, *in_args):
+        args = [*self.build_prefix(), *in_args]
         if not silent:
             print("Running: '"+" ".join(args)+"'")
+        return args
 
-        try:
-            return subprocess.run(args, input=pipetext, capture_output=True, text=True, check=True)
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Running '{' '.join(e.cmd)}' returned {e.returncode}"+"\n\n"+e.stderr) from e
+    def output_mode(self, raw=None, encoding=None, errors=None):
+        return (
+            self.raw if raw is None else raw,
+            encoding if encoding else self.encoding,
+            errors if errors else self.errors
+        )
+
+    def run(self, *in_args, pipetext=None, raw=None, encoding=None, errors=None, cached=None, cache_files=(), timeout=None, cancel=None):
+        """
+        runs the command, cached if the runner is cacheable or cached=True.
+        cache_files are input files whose mtimes are part of the cache key.
+        past timeout seconds, or once cancel is cancelled, the command's process
+        group is stopped and timed_out is raised with the partial output.
+        """
+        args = self.build_args(*in_args)
+        raw, encoding, errors = self.output_mode(raw, encoding, errors)
+        cache = None
+        if cached or (cached is None and self.cacheable):
+            cache = self.cache if self.cache else results
+            key = cache.key(args, encode(pipetext, encoding), cache_files)
+            if entry := cache.get(key):
+                out = result(args, 0, *entry, raw, encoding, errors)
+                out.decoder = self.decoder
+                return out
+        info = None
+        timeout = self.timeout if timeout is None else timeout
+        if hooks or self.instrumented or timeout is not None or cancel is not None:
+            proc, info, stopped = run_watched(args, encode(pipetext, encoding), timeout, cancel, bool(hooks or self.instrumented))
+            if stopped:
+                e = timed_out(args, timeout, result(args, proc.returncode, proc.stdout, proc.stderr, raw, encoding, errors), stopped)
+                e.stats = info
+                raise e
+        else:
+            proc = subprocess.run(args, input=encode(pipetext, encoding), capture_output=True, **spawn_options(args))
+        if proc.returncode:
+            e = error(args, proc.returncode, decode(proc.stderr, encoding, "replace"))
+            e.stats = info
+            raise e
+        if cache:
+            cache.put(key, (proc.stdout, proc.stderr))
+        out = result(args, proc.returncode, proc.stdout, proc.stderr, raw, encoding, errors)
+        out.stats = info
+        out.decoder = self.decoder
+        return out
 
+    def pipe(self, *in_args):
+        """
+        a single stage pipeline with positional args, for use with |.
+        """
+        return pipeline(self.build_args(*in_args))
+
+    def __or__(self, other):
+        return self.pipe() | other
+
+    def run_many(self, arg_sets, max_workers=None, ordered=True, pipetext=None, **kwargs):
+        """
+        runs the command once per entry in arg_sets, max_workers at a time.
+        an entry is a single arg or a sequence of args.
+        failures don't stop the batch, the exception is returned in place of the
+        result: a RuntimeError if the command failed, an OSError if it couldn't
+        be started (E2BIG, ENOENT...). results are in input order, or completion
+        order if not ordered.
+        """
+        import concurrent.futures
+        def run_one(arg_set):
+            if isinstance(arg_set, str): arg_set = (arg_set,)
+            try:
+                return self.run(*arg_set, pipetext=pipetext, **kwargs)
+            except (RuntimeError, OSError) as e:
+                return e
+
+        max_workers = max_workers if max_workers else os.cpu_count()
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+            futures = [pool.submit(run_one, a) for a in arg_sets]
+            if not ordered:
+                futures = concurrent.futures.as_completed(futures)
+            return [f.result() for f in futures]
+
+    def run_chunked(self, *in_args, max_args=None, max_workers=1, **kwargs):
+        """
+        xargs for huge arg lists: runs the command as many times as it takes to fit
+        in_args in argv alongside the flags, max_workers runs at a time.
+        max_args caps the args per run. kwargs go to run().
+        returns one result with every run's stdout and stderr in input order, and
+        each run's own result in .results. if any run failed, raises RuntimeError
+        once they've all finished, with the failures in .failures and the merged
+        result in .partial.
+        """
+        import errno
+        raw, encoding, errors = self.output_mode(kwargs.get("raw"), kwargs.get("encoding"), kwargs.get("errors"))
+        def run_one(chunk):
+            try:
+                return [self.run(*chunk, **kwargs)]
+            except RuntimeError as e:
+                return [e]
+            except OSError as e:
+                # the limit is a guess, halve until it fits.
+                if e.errno != errno.E2BIG or len(chunk) < 2: raise
+                return run_one(chunk[:len(chunk)//2]) + run_one(chunk[len(chunk)//2:])
+
+        chunks = chunk_args(self.build_prefix(), in_args, max_args=max_args)
+        if max_workers == 1:
+            runs = [run_one(c) for c in chunks]
+        else:
+            import concurrent.futures
+            max_workers = max_workers if max_workers else os.cpu_count()
+            with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+                runs = list(pool.map(run_one, chunks))
+        runs = [r for rs in runs for r in rs]
+
+        outputs = [r.partial if isinstance(r, timed_out) else r for r in runs]
+        outputs = [o for o in outputs if isinstance(o, result)]
+        out = result([o.args for o in outputs], 0,
+                     b"".join([o.stdout_bytes or b"" for o in outputs]),
+                     b"".join([o.stderr_bytes or b"" for o in outputs]),
+                     raw, encoding, errors)
+        out.results = runs
+        out.decoder = self.decoder
+        failures = [r for r in runs if isinstance(r, RuntimeError)]
+        if failures:
+            e = RuntimeError(f"{len(failures)} of {len(runs)} runs failed, the first:\n\n"+failures[0].args[0])
+            e.cmd, e.returncode, e.stderr = failures[0].cmd, failures[0].returncode, failures[0].stderr
+            e.failures, e.partial = failures, out
+            out.returncode = e.returncode
+            raise e
+        return out
+
+    def coprocess(self, *in_args, workers=1, sentinel=None, timeout=None):
+        """
+        starts a coprocess pool for this runner's current flags.
+        """
+        return coprocess(self.build_args(*in_args), workers, sentinel, timeout)
+
+    async def arun(self, *in_args, pipetext=None, raw=None, encoding=None, errors=None, timeout=None, cancel=None):
+        """
+        asyncio version of run(), limited by get_async_limit().
+        cancelling the task stops the command too.
+        """
+        import asyncio
+        args = self.build_args(*in_args)
+        raw, encoding, errors = self.output_mode(raw, encoding, errors)
+        timeout = self.timeout if timeout is None else timeout
+        stdin = encode(pipetext, encoding)
+        async with get_async_limit():
+            start = time.perf_counter()
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=subprocess.PIPE if pipetext is not None else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                **spawn_options(args),
+                # always, cancelling the task is how asyncio code gives up on a run.
+                **group_options(True)
+            )
+            spawned = time.perf_counter()
+            async with async_watchdog(proc, timeout, cancel) as dog:
+                try:
+                    stdout, stderr = await proc.communicate(stdin)
+                except asyncio.CancelledError:
+                    await astop(proc)
+                    await proc.wait()
+                    raise
+        info = None
+        if hooks or self.instrumented:
+            # asyncio reaps the child itself, so there's no rusage.
+            info = report(args, proc.returncode, spawned-start, time.perf_counter()-start, None,
+                          len(stdin) if stdin else 0, len(stdout), len(stderr))
+        if dog.stopped:
+            e = timed_out(args, timeout, result(args, proc.returncode, stdout, stderr, raw, encoding, errors), dog.stopped)
+            e.stats = info
+            raise e
+        if proc.returncode:
+            e = error(args, proc.returncode, decode(stderr, encoding, "replace"))
+            e.stats = info
+            raise e
+        out = result(args, proc.returncode, stdout, stderr, raw, encoding, errors)
+        out.stats = info
+        out.decoder = self.decoder
+        return out
+
+    def records(self, *in_args, decoder=None, pipetext=None, encoding=None, errors=None, timeout=None, cancel=None, chunk_size=64*1024):
+        """
+        stream() decoded into records as they're produced, by decoder or the
+        runner's default. see lines, columns, table and json_lines.
+        """
+        _, encoding, errors = self.output_mode(None, encoding, errors)
+        decoder = get_decoder(decoder if decoder else self.decoder)
+        chunks = self.stream(*in_args, pipetext=pipetext, chunk_size=chunk_size, raw=True, timeout=timeout, cancel=cancel)
+        return decoder(chunks, encoding, errors)
+
+    def stream(self, *in_args, pipetext=None, chunk_size=None, raw=None, encoding=None, errors=None, timeout=None, cancel=None):
+        """
+        yields stdout as it arrives, line by line or in chunk_size pieces.
+        raises RuntimeError once the output is exhausted if the command failed,
+        or timed_out if it was stopped, with only stderr in its partial result.
+        """
+        import codecs
+        args = self.build_args(*in_args)
+        raw, encoding, errors = self.output_mode(raw, encoding, errors)
+        encoding = encoding if encoding else locale.getpreferredencoding(False)
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE if pipetext is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **spawn_options(args),
+            **group_options(timeout is not None or cancel is not None)
+        )
+        spawned = time.perf_counter()
+        stderr = []
+        threads = [threading.Thread(target=lambda: stderr.append(drain(proc.stderr, stderr_limit)), daemon=True)]
+        if pipetext is not None:
+            threads.append(threading.Thread(target=feed, args=(proc.stdin, encode(pipetext, encoding)), daemon=True))
+        for t in threads: t.start()
+        finished = False
+        with watchdog(proc, timeout, cancel) as dog:
+            try:
+                if raw and chunk_size:
+                    while chunk := proc.stdout.read1(chunk_size):
+                        yield chunk
+                elif raw:
+                    yield from proc.stdout
+                elif chunk_size:
+                    decoder = codecs.getincrementaldecoder(encoding)(errors)
+                    while chunk := proc.stdout.read1(chunk_size):
+                        if text := decoder.decode(chunk):
+                            yield text
+                    if text := decoder.decode(b"", final=True):
+                        yield text
+                else:
+                    yield from io.TextIOWrapper(proc.stdout, encoding, errors)
+                finished = True
+            finally:
+                if not finished and proc.poll() is None:
+                    # abandoned part way, no grace needed.
+                    stop(proc, 0)
+                proc.wait()
+                for t in threads: t.join()
+                proc.stdout.close()
+                if hooks:
+                    report(args, proc.returncode, spawned-start, time.perf_counter()-start, None,
+                           len(encode(pipetext, encoding)) if pipetext is not None else 0, None,
+                           len(stderr[0]) if stderr else 0)
+        if dog.stopped and finished:
+            raise timed_out(args, timeout, result(args, proc.returncode, None, stderr[0] if stderr else b"", raw, encoding, errors), dog.stopped)
+        stderr = decode(stderr[0], encoding, "replace") if stderr else ""
+        if proc.returncode:
+            raise error(args, proc.returncode, stderr)
@@ -0,0 +1,1160 @@
+import argparse
+import contextlib
+import fnmatch
+import functools
+import io
+import concurrent.futures
+import hashlib
+import importlib
+import itertools
+import json
+import subprocess
+import re
+import os
+import time
+import keyword
+import builtins
+import shutil
+
+from clpy import program_name, description, version, clpydir, clidir
+from clpy.__cli__ import decoders
+
+flag_name = "flags"
+# seconds a --help probe gets before it's killed.
+probe_timeout = 10
+# 64KiB chunks of --help output read ahead of the parser.
+help_buffer = 64
+# man_text = subprocess.getoutput("man -P cat "+args.command).split("\n")
+# todo: It might be better to have a base class + kwargs
+class_fmt = """# clpy generated, do not modify by hand
+import clpy.__cli__ as cli
+from enum import Enum, auto
+
+class {f}(Enum):
+{enum}
+
+class runner(cli.cli):
+    \"\"\"
+{usage}{docargs}{docflags}
+    \"\"\"
+    __options = {options}
+    cacheable = {cacheable}
+    decoder = {decoder!r}
+    source = {source!r}
+    def __init__(self, *in_flags):
+        self.__cmd = {usage_cmd}
+        self.__g_flags = {g_flags}
+        super().__init__(self.__cmd, self.__options, {f}, self.__g_flags, *in_flags)
+        pass
+    def add_flags(self, *in_flags):
+        \"\"\"
+{docflags2}
+        \"\"\"
+        super().add_flags(self, *in_flags)
+        pass
+
+def run(*in_flags, pipetext=None, raw=None, encoding=None, errors=None, cached=None, cache_files=(), timeout=None, cancel=None):
+    cmd = cli.frozen(runner, *in_flags)
+    return cmd.run(pipetext=pipetext, raw=raw, encoding=encoding, errors=errors, cached=cached, cache_files=cache_files, timeout=timeout, cancel=cancel)
+
+async def arun(*in_flags, pipetext=None, raw=None, encoding=None, errors=None, timeout=None, cancel=None):
+    cmd = cli.frozen(runner, *in_flags)
+    return await cmd.arun(pipetext=pipetext, raw=raw, encoding=encoding, errors=errors, timeout=timeout, cancel=cancel)
+
+def run_many(arg_sets, *in_flags, max_workers=None, ordered=True, pipetext=None, **kwargs):
+    cmd = cli.frozen(runner, *in_flags)
+    return cmd.run_many(arg_sets, max_workers=max_workers, ordered=ordered, pipetext=pipetext, **kwargs)
+
+def run_chunked(in_args, *in_flags, max_args=None, max_workers=1, **kwargs):
+    cmd = cli.frozen(runner, *in_flags)
+    return cmd.run_chunked(*in_args, max_args=max_args, max_workers=max_workers, **kwargs)
+
+def records(*in_flags, decoder=None, pipetext=None, encoding=None, errors=None, timeout=None, cancel=None):
+    cmd = cli.frozen(runner, *in_flags)
+    return cmd.records(decoder=decoder, pipetext=pipetext, encoding=encoding, errors=errors, timeout=timeout, cancel=cancel)
+
+def coprocess(*in_flags, workers=1, sentinel=None, timeout=None):
+    cmd = cli.frozen(runner, *in_flags)
+    return cmd.coprocess(workers=workers, sentinel=sentinel, timeout=timeout)
+
+def stream(*in_flags, pipetext=None, chunk_size=None, raw=None, encoding=None, errors=None, timeout=None, cancel=None):
+    cmd = cli.frozen(runner, *in_flags)
+    return cmd.stream(pipetext=pipetext, chunk_size=chunk_size, raw=raw, encoding=encoding, errors=errors, timeout=timeout, cancel=cancel)
+
+"""
+
+class reg:
+    # all used with pattern.match(line, pos), so they're anchored without slicing.
+    usage = re.compile("(?:usage:) ([A-Z0-9\+\-]+)\s+", re.IGNORECASE)
+    whitespace = re.compile("\s")
+    ellipsis = re.compile(" ?\.\.\.")
+    start_trailing = re.compile(" ?--")
+    start_optional = re.compile(" ?\[")
+    end_optional = re.compile(" ?\]")
+    start_enum = re.compile(" ?\{")
+    end_enum = re.compile(" ?\}")
+    g_flag = re.compile("\s+(--?[A-Z0-9][A-Z0-9\-#_]*)(?:\s+|=|,|\[=|$)", re.IGNORECASE)
+    switch = re.compile("(?:\s+)?(--?[A-Z0-9][A-Z0-9\-#_]*)", re.IGNORECASE)
+    has_arg = re.compile("\s{2,8}(?!---)(-{0,2}[A-Z])", re.IGNORECASE)
+    argument = re.compile("(?: |=)?((?!-)<?[A-Z0-9\-#_]+>?)", re.IGNORECASE)
+    equals = re.compile("(=|\[=)")
+    comma = re.compile(", ?")
+    or_ = re.compile("(?: ?\|) ?")
+    stop = re.compile("\s\s")
+
+def compile_tokens(*names):
+    # one alternation over the reg patterns, tried in the order given.
+    # the named group that matched (match.lastgroup) says which one it was.
+    return re.compile("|".join([f"(?P<{n}>{getattr(reg, n).pattern})" for n in names]), re.IGNORECASE)
+
+reg.option_token = compile_tokens(
+    "argument", "switch",
+    "start_optional", "end_optional", "start_enum", "end_enum",
+    "ellipsis", "equals", "comma", "or_", "start_trailing", "stop"
+)
+reg.usage_token = compile_tokens(
+    "switch", "argument",
+    "start_optional", "end_optional", "start_enum", "end_enum",
+    "ellipsis", "comma", "or_"
+)
+
+class OptionMeta:
+    def str(option):
+        out = []
+        just = 16
+        if option.lines:
+            out.append("["+"".ljust(64,'-')+"]")
+            out.append("["+option.name.center(64,'-')+"]")
+            out.append("["+"".ljust(64,'-')+"]")
+            out.append("original line/s:")
+            out.append("'\n".join([f"line {n}: '{l}" for n, l in option.lines])+"'\n")
+        if option.usage:
+            out.append("usage:".ljust(just)+option.usage)
+            if option.bad_match: out.append("bad_match:".ljust(just)+str(option.bad_match)+": "+option.bad_match_reason)
+            if option.wants_equals: out.append("equals: ".ljust(just)+str(option.wants_equals))
+            if option.is_positional: out.append("is_positional: ".ljust(just)+str(option.is_positional))
+        if option.switch:
+            out.append("switch:".ljust(just)+option.switch)
+        if option.nargs:
+            out.append("nargs:".ljust(just)+str(option.nargs))
+        if option.arguments:
+            out.append("arguments:".ljust(just)+", ".join([f.to_str() for f in option.arguments]))
+        if option.children:
+            out.append("["+"children".center(64,'-')+"]")
+            out.extend([OptionMeta.str(c) for c in option.children])
+        if option.doc:
+            tab = "".ljust(just, " ")
+            out.append("docs:".ljust(just)+("\n"+tab).join(option.doc))
+        else:
+            out.append("["+"".ljust(64,'-')+"]")
+        return "\n".join(out)
+
+def debug_print(prologue, unused, options, usage, name, verbose, no_bad_matches):
+    print("".ljust(128, "="))
+    print(f" {name} ".center(128, "="))
+    print("".ljust(128, "="))
+    if verbose and usage:
+        print(" usage ".center(128, "_"))
+        print("\n".join([f"line {n}: {l}" for n, l in usage.lines]))
+        for option in usage.options:
+            print(OptionMeta.str(option))
+    print("")
+    if verbose and prologue:
+        print(" prologue ".center(128, "_"))
+        print("\n".join(prologue))
+    print("")
+    print(" options ".center(128, "_"))
+    if not no_bad_matches:
+        print("".ljust(128, "-"))
+        print(" bad matches ".center(128, "-"))
+        print("".ljust(128, "-"))
+        print("")
+        for o in options:
+            if o.bad_match:
+                print(OptionMeta.str(o))
+                print("")
+        print("")
+    print("".ljust(128, "-"))
+    print(" good matches ".center(128, "-"))
+    print("".ljust(128, "-"))
+    print("")
+    for o in options:
+        if not o.bad_match:
+            print(OptionMeta.str(o))
+            print("")
+    print("")
+    print("".ljust(64, "-"))
+    print("")
+    if verbose:
+        print("\n".join(unused))
+
+class Command:
+    name = ""
+    usage = ""
+    options = None
+    
+    def __init__(self):
+        options = []
+        pass
+    
+# the parse tree keeps (start, end) offsets into the lines it was parsed from
+# rather than re.Match objects, and shares empty tuples until something is
+# added. a big help page makes thousands of these, so they're slotted.
+
+class Argument:
+    __slots__ = ["line", "choices", "is_optional", "wants_equals", "default"]
+
+    def to_str(self):
+        out = ", ".join([self.line[s:e] for s, e in self.choices])
+        if len(self.choices) > 1:
+            out = "{"+out+"}"
+        if self.is_optional:
+            out = f"[{out}]"
+        return out
+            
+    def __init__(self, line, span, is_optional = False, wants_equals = False):
+        self.line = line
+        self.choices = (span,)
+        self.is_optional = is_optional # else is positional
+        self.wants_equals = wants_equals
+        self.default = None
+    
+class Option:
+    __slots__ = [
+        "source", "line_num", "num_lines", "switch_span",
+        "name", "doc", "usage", "arguments", "nargs", "parent", "children", "span",
+        "bad_match", "bad_match_reason", "ellipsis", "wants_equals",
+        "option_depth", "enum_depth", "is_parent", "is_positional",
+    ]
+
+    def __init__(self, source=None, line_num=0, switch_span=(0, 0)):
+        # source is its block's lines, shared with its children, the first one
+        # is line_num in the help text, counting from 1.
+        self.source = source
+        self.line_num = line_num
+        self.num_lines = 0
+        self.switch_span = switch_span
+        self.name = None
+        self.doc = ()
+        self.usage = None
+        self.arguments = ()
+        self.nargs = None
+        self.parent = None
+        self.children = ()
+        self.span = None
+        self.bad_match = False
+        self.bad_match_reason = ""
+        self.ellipsis = False
+        self.wants_equals = False
+        self.option_depth = 0
+        self.enum_depth = 0
+        self.is_parent = False
+        self.is_positional = False
+        pass
+
+    @property
+    def switch(self):
+        # the flag or positional as written, like "--all".
+        start, end = self.switch_span
+        return self.source[0][start:end] if self.source else ""
+
+    @property
+    def lines(self):
+        # (line_num, line) for the lines it was parsed from, children have none.
+        return [(self.line_num+i, self.source[i]) for i in range(self.num_lines)]
+
+    def to_dict(self):
+        return {
+            o.name : {
+                "switch": o.switch,
+                "nargs": o.nargs,
+                "wants_equals": o.wants_equals
+            }
+            for o in [self, *self.children]
+        }
+
+class ParseContext:
+    """
+    the state shared while parsing one command's help.
+    valid_flags: every flag-like word found in the help text, sorted.
+    all_names: the names of the options that validated, to their option.
+    """
+    valid_flags = None
+    all_names = None
+
+    def __init__(self, valid_flags=None):
+        self.valid_set = set(valid_flags) if valid_flags else set()
+        self.valid_flags = sorted(self.valid_set)
+        self.all_names = {}
+        pass
+
+class Usage:
+    __slots__ = ["source", "line_num", "indent", "cmd_span", "cmd", "options"]
+
+    def __init__(self, line, line_num, match):
+        self.source = [line]
+        self.line_num = line_num
+        # continuation lines are indented at least this far.
+        self.indent = match.end()
+        self.cmd_span = match.span(1)
+        self.cmd = None
+        self.options = []
+
+    @property
+    def lines(self):
+        return [(self.line_num+i, l) for i, l in enumerate(self.source)]
+
+        
+        
+def option_add_nargs(option):
+    args = option.arguments
+    ellipsis = option.ellipsis
+    if args:
+        if not any([a.is_optional for a in args]) and not ellipsis:
+            option.nargs = str(len(args))
+        elif len(args) == 1 and args[0].is_optional and not ellipsis:
+            option.nargs = "?"
+        elif all([a.is_optional for a in args]) and ellipsis:
+            option.nargs = "*"
+        elif len(args) > 1 and not args[0].is_optional and all([a.is_optional for a in args[1:]]) and ellipsis:
+            option.nargs = "+"
+        elif all([not a.is_optional for a in args]) and ellipsis:
+            option.nargs = "A..."
+    elif ellipsis:
+        option.nargs = "..."
+
+reserved_names = set(keyword.kwlist)
+builtin_names = set(dir(builtins))
+
+def sanatise_name(flag):
+    flag = flag.lstrip("-")
+    flag = flag.replace("-", "_")
+    if flag in reserved_names: flag = flag+"_"
+    if flag in builtin_names: flag = flag+"_"
+    return flag
+
+def parse_option(line, pos, line_num, match):
+    block = [line]
+    option = Option(block, line_num, match.span(1))
+    option.is_parent = True
+    option.num_lines = 1
+    option.span = match.span(1)
+    child = option
+    argument = None
+
+    # Start searching for options etc.
+    while(match):
+
+        # Check to see if we've moved out of scope
+        if child.option_depth < 0: break
+        if child.enum_depth < 0: break
+
+        pos = match.end()
+
+        # Are we done?
+        if pos >= len(line): break
+
+        match = reg.option_token.match(line, pos)
+        token = match.lastgroup if match else None
+
+        # Handle arguments
+        if token == "argument":
+            match = reg.argument.match(line, pos)
+
+            if wants_equals := bool(reg.equals.match(line, pos)):
+                child.wants_equals = True
+
+            if argument and child.enum_depth != 0:
+                argument.choices += (match.span(1),)
+            else:
+                argument = Argument(line, match.span(1), child.option_depth != 0, wants_equals)
+                child.arguments += (argument,)
+                argument = argument if child.enum_depth != 0 else None
+
+        # Handle child options
+        elif token == "switch":
+            match = reg.switch.match(line, pos)
+            # print(child.switch)
+            # print([x.to_str() for x in child.arguments])
+            
+            if child.option_depth:
+                # throw this child out,
+                # it's not a part of this option.
+                child.bad_match = True
+                child.bad_match_reason = "attempted optional child switch, not supported."
+                child.option_depth = 0
+                # print(match.groups()[0])
+                break
+            option_add_nargs(child)
+            child = Option(block, line_num, match.span(1))
+            option.children += (child,)
+            child.parent = option
+            child.span = (pos, match.end(1))
+
+        # Handle brackets
+        elif token == "start_optional": child.option_depth += 1
+        elif token == "end_optional": child.option_depth -= 1
+        elif token == "start_enum": child.enum_depth += 1
+        elif token == "end_enum": child.enum_depth -= 1
+
+        # Handle syntactic sugar
+        elif token == "ellipsis": child.ellipsis = True
+        elif token == "equals": child.wants_equals = True
+        elif token == "stop":
+            pos = match.end()
+            break
+
+        if not match:
+            # Something went wrong.
+            # Reverting to start pos.
+            pos = option.span[1]
+            option.bad_match = True
+            option.bad_match_reason = f"No regex to match '{line[pos:]}'"
+            break
+
+    option_add_nargs(child)
+    # todo: this is a hack to fix cases switch usage isn't explained in the parent.
+    # it would probably be better to split each child into it's own long+short option
+    # when creating modules.
+    for child in option.children:
+        if child.nargs and not option.nargs:
+            option.nargs = child.nargs
+        # if child.wants_equals and not option.wants_equals:
+        #     option.wants_equals = child.wants_equals
+
+    opt_usage, doc = line[option.span[0]:pos], line[pos:]
+    if doc.strip(): option.doc = (doc.strip(),)
+    option.usage = opt_usage.strip()
+
+    for o in [option, *option.children]:
+        o.name = sanatise_name(o.switch)
+        
+    option.is_positional = not option.children and not option.switch.startswith("-")
+    return option, pos
+
+
+def parse_man(text, start = 0, context=None, workers=1):
+    id_synopsis = text.index("SYNOPSIS")
+    id_description = text.index("DESCRIPTION")
+    start = id_synopsis+1
+    end = id_description
+    # skip subsection headings like tar's "   Traditional usage", they're indented less.
+    while start < end-1 and not text[start].startswith("       "):
+        start += 1
+    re_title = re.compile("^[A-Z]+")
+    # adding usage to better match what parse_usage expects
+    text[start] = "Usage: "+text[start].lstrip()
+    usage, _, _ = parse_usage(text, start=start)
+    sections = []
+    start = end
+    current = ""
+    for line in text[start:]:
+        if match := re_title.search(line):
+            if current not in ["EXAMPLES"]:
+                sections.append((start, end))
+                current = line
+            else:
+                current = line
+            start = end
+        end += 1
+        
+    # todo: throw out sections with bad ratios of bad match options.
+    # atm, if it's positional, check if it's in usage, if not, throw it out.
+    options = []
+    # print([o.switch for o in usage.options])
+    context = context if context else ParseContext()
+    context.all_names = {}
+    if not usage: return None, []
+    in_usage = {o.switch for o in usage.options}
+    # sections scan independently, but validate in order as names carry between them.
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        scanned = list(pool.map(lambda s: scan_help(text[s[0]:s[1]], s[0]), sections))
+    for _, _, out_options in scanned:
+        validate_options(out_options, context)
+        for option in out_options:
+            if option.is_positional:
+                # print(option.switch)
+                if option.switch in in_usage:
+                    # print("adding positional!")
+                    options.append(option)
+                else:
+                    # print("failed to add '"+option.switch+"' it's not in usage.")
+                    pass
+            else:
+                options.append(option)
+            pass
+    
+    
+    return usage, options
+
+def parse_usage(text, start = 0):
+    # Parse usage    
+    usage = None
+    argument = None
+    line_num = start
+    num_options = 0
+    # Only checking the first 32 lines.
+    for line in text[start:32]:
+        line_num += 1
+        pos = 0
+        if not usage and (not (match := reg.usage.match(line))):
+            continue
+        if match or (usage and len(line)-len(line.lstrip()) >= usage.indent
+              and usage.line_num+len(usage.source) == line_num):
+
+            if not usage:
+                usage = Usage(line, line_num, match)
+            else:
+                pos = usage.indent
+                match = None
+                usage.source.append(line)
+
+            while pos < len(line):
+                if match:
+                    pos = match.end()
+
+                match = reg.usage_token.match(line, pos)
+                token = match.lastgroup if match else None
+
+                # Handle options and arguments
+                if token == "switch" or token == "argument":
+                    match = getattr(reg, token).match(line, pos)
+                    option, pos = parse_option(line, pos, line_num, match)
+                    option.doc = None
+                    usage.options.append(option)
+                    match = None
+
+                # Outer brackets and syntactic sugar are skipped over
+                elif not match:
+                    if pos < len(line):
+                        print("premature break: "+line[pos:])
+                    break
+        else:
+            break
+
+    if not usage:
+        line_num = 0
+    else:
+        line_num -= 1
+
+    cmd = []
+    if usage:
+        for option in usage.options:
+            # print(option.switch+" "+str(option.option_depth))
+            # print(option.is_positional)
+            if option.is_positional and option.option_depth == 0:
+                cmd.append(option)
+                pass
+            else:
+                break
+        # print(cmd)
+        usage.options = [o for o in usage.options if o not in cmd]
+        start, end = usage.cmd_span
+        usage.cmd = [usage.source[0][start:end], *[o.switch for o in cmd]]
+    # print(usage.cmd)
+    return usage, start, line_num
+
+def validate_option(option, context):
+    if not option:
+        return
+    
+    if not option.doc:
+        option.bad_match = True
+        option.bad_match_reason = "Couldn't find a doc string."
+    # elif option and option.lines:
+    #     start = option.lines[0][0]
+    #     last = -1
+    #     for oline in option.lines:
+    #         if last != (oline[0]-start)-1:
+    #             option.bad_match = True
+    #             option.bad_match_reason = "Unexpected line break."
+    #             break
+    #         last = oline[0]-start
+    #         pass
+    #     pass
+    else:
+        names = set()
+        for o in [option, *option.children]:
+            if o.name not in names:
+                names.add(o.name)
+            else:
+                option.bad_match = True
+                option.bad_match_reason = f"{o.name} is a repeated name in children"
+                break
+
+            if o.name in context.all_names:
+                # we can't allow two flags with the same name
+                option.bad_match = True
+                option.bad_match_reason = f"The name '{o.name}' already exists"
+                break
+
+            if switch := o.switch:
+                if switch not in context.valid_set:
+                    option.bad_match = True
+                    option.bad_match_reason = f"Flag '{switch}' not in the valid list"
+            
+            # todo: consider appending doc strings or something?
+            if not o.name:
+                option.bad_match = True
+                option.bad_match_reason = f"The name was empty!"
+                break
+            
+
+    if not option.bad_match:
+        for o in [option, *option.children]:
+            context.all_names[o.name] = o
+            pass
+    else:
+        for o in option.children:
+            o.bad_match = True
+            o.bad_match_reason = "Bad parent"
+
+def parse_help(text, start=0, end=0, iterative=False, context=None):
+    context = context if context else ParseContext()
+    prologue, unused, options = scan_help(text[start:end or len(text)], start, iterative)
+    validate_options(options, context)
+    return prologue, unused, options
+
+def scan_help(lines, line_num=0, iterative=False, keep_lines=True):
+    """
+    finds the options in lines, any iterable of them, line_num lines in.
+    without keep_lines, nothing but each option's first line is held on to,
+    the prologue, unused and continuation lines are only for debugging.
+    """
+    option = None
+    prologue = []
+    unused = []
+    options = []
+    
+    for line in lines:
+        line_num += 1
+        pos = 0
+        while pos < len(line):
+
+            if match := reg.has_arg.match(line, pos):
+                # print(line)
+                # print("starts: "+str(match.start(1)))
+                pos = match.start(1)
+                
+                if match := reg.switch.match(line, pos): pass
+                elif match := reg.argument.match(line, pos): pass
+                if match:
+                    # validate_option(option)
+                    option, pos = parse_option(line, pos, line_num, match)
+                    options.append(option)
+
+                    if not option.bad_match:
+                        pos = len(line)
+                    elif not iterative:
+                        pos = len(line)
+                else:
+                    print("Oh no! this is bad.")
+                    print(line[pos:])
+                        
+                    
+            elif option and reg.whitespace.match(line):
+                # check if text starts past switch text
+                pos = len(line) - len(line.lstrip())
+                if pos > option.span[0]:
+                    pos = len(line)
+                    if keep_lines:
+                        option.source.append(line)
+                        option.num_lines += 1
+                    stripped = line.strip()
+                    if stripped:
+                        option.doc += (stripped,)
+                else:
+                    pos = len(line)
+                    option = None
+                    if keep_lines: unused.append(line)
+
+            elif not options:
+                pos = len(line)
+                if keep_lines: prologue.append(line)
+                
+            else:
+                pos = len(line)
+                option = None
+                if keep_lines: unused.append(line)
+    
+    return prologue, unused, options
+
+def validate_options(options, context):
+    for o in options: validate_option(o, context)
+    if len(context.all_names) < len(context.valid_flags):
+        found = {v.switch for v in context.all_names.values()}
+        by_name = {}
+        for o in options:
+            by_name.setdefault(o.name, []).append(o)
+        for flag in context.valid_flags:
+            if flag not in found:
+                for o in by_name.get(sanatise_name(flag), []):
+                    # Try to salvage ones we know should exist.
+                    o.bad_match = False
+                    # Add a flag to let users know we're not 
+                    # sure how many args there are
+                    # o.nargs = "?..."
+                    o.nargs = None
+                    o.doc = ("Warning: There were errors while parsing this flag.", *o.doc)
+                    o.arguments = ()
+                    context.all_names[o.name] = o
+        
+    pass
+
+def options_str_list(options, tab = 4, length = 64):
+    lines = [",".join([o.name, *[c.name for c in o.children]]) for o in options]
+    lines = [a+"," if a != lines[-1] else a for a in lines]
+    lines = "".join(lines).split(",")
+    lines = [a+", " if a != lines[-1] else a for a in lines]
+    options_str = ""
+    option_lines = []
+    for d in lines:
+        if len(options_str+d) > length:
+            option_lines.append(options_str)
+            options_str = d
+        else:
+            options_str += d
+    if options_str:
+        option_lines.append(options_str)
+    return option_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=program_name, description=description)
+    parser.add_argument("command", nargs="*", help="the commands to convert to modules")
+    parser.add_argument("--globals", "-g", action="append", help="flags to set globally for the module")
+    parser.add_argument("-nb", "--no_bad_matches", action="store_true", help="don't display bad matches.")
+    parser.add_argument("--verbose", action="store_true", help="show unused text etc.")
+    parser.add_argument("-v", "--version", action="version", version=version)
+    parser.add_argument("--debug", action="store_true", help="print debug information, don't build modules")
+    parser.add_argument("--cacheable", action="store_true", help="cache the module's results by default, for idempotent commands")
+    parser.add_argument("--decoder", choices=[*decoders], help="the module's default decoder for records()")
+    parser.add_argument("--source", choices=["auto", "man", "help"], default="auto", help="parse the man page, --help, or the man page falling back to --help")
+    parser.add_argument("-f", "--force", action="store_true", help="regenerate even if the command hasn't changed")
+    parser.add_argument("-j", "--jobs", type=int, help="number of modules generated at once in bulk or by update_clpy, defaults to the cpu count")
+    parser.add_argument("--manifest", help="generate every command listed in this file, one per line")
+    parser.add_argument("--glob", action="append", help="generate every command on PATH matching this pattern")
+    parser.add_argument("--all", action="store_true", help="generate every command on PATH")
+    parser.add_argument("--report", help="write a json report of a bulk run here")
+    # Tests
+    # todo: make these self verifying.
+    parser.add_argument("-t1", "--test1", help="test: default argparse arg for test")
+    parser.add_argument("-t2", "--test2", nargs=3, metavar=("1st","2nd", "3rd"), help="test: nargs should be 3")
+    parser.add_argument("-t3", "--test3", nargs="+", help="test: nargs should be +")
+    parser.add_argument("-t4", "--test4", nargs="*", help="test: nargs should be *")
+    parser.add_argument("-t5", "--test5", nargs="?", help="test: nargs should be ?")
+    parser.add_argument("-t6", "--test6", nargs="...", help="test: nargs should be ...")
+    parser.add_argument("-t7", "--test7", nargs="A...", help="test: nargs should be A...")
+    parser.add_argument("-t8", "--test8", choices=["1st", "2nd", "3rd"], help="test: there should be 3 choices")
+    
+    args = parser.parse_args()
+    settings = dict(defaults=args.globals, cacheable=args.cacheable, decoder=args.decoder, force=args.force, source=args.source)
+    if args.command == ["update_clpy"]:
+        __regenerate_all__(args.jobs, args.force)
+    elif len(args.command) == 1 and not (args.manifest or args.glob or args.all):
+        generate(args.command[0], debug=args.debug, **settings)
+    else:
+        cmds = [*args.command]
+        if args.manifest: cmds.extend(read_manifest(args.manifest))
+        if args.glob or args.all: cmds.extend(path_commands(["*"] if args.all else args.glob))
+        if not cmds: parser.error("no commands to generate")
+        generate_many(list(dict.fromkeys(cmds)), args.jobs, args.report, **settings)
+
+def write_if_changed(path, data):
+    # leaves unchanged files (and their .pyc) alone.
+    mode = "b" if isinstance(data, bytes) else ""
+    if os.path.exists(path):
+        with open(path, "r"+mode) as f:
+            if f.read() == data: return path
+    with open(path, "w"+mode) as f:
+        f.write(data)
+    return path
+
+@functools.cache
+def generator_hash():
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def fingerprint(cmd, defaults=None, cacheable=False, decoder=None, source="auto"):
+    """
+    identifies a command's executable and generation settings, None if not on PATH.
+    """
+    exe = shutil.which(cmd.split()[0])
+    if not exe: return None
+    exe = os.path.realpath(exe)
+    stat = os.stat(exe)
+    key = [cmd, exe, stat.st_size, stat.st_mtime_ns, stat.st_ino, defaults, cacheable, decoder, source, version, generator_hash()]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+def fingerprint_path(cmd):
+    return os.path.join(clidir, "__fingerprints__", hashlib.sha256(cmd.encode()).hexdigest()+".json")
+
+def is_generated(cmd, key):
+    # the summary of the last generation if it's still current, else None.
+    try:
+        with open(fingerprint_path(cmd)) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached["key"] == key and all(os.path.exists(p) for p in cached["files"]):
+        return {**cached.get("summary", {}), "files": cached["files"], "up_to_date": True}
+    return None
+
+def help_output(cmd, timeout=None):
+    """
+    cmd --help with stderr mixed in, like getoutput() gave, but without a shell
+    and with stdin closed so nothing sits waiting on it. a probe still going
+    after timeout seconds is killed along with its children.
+    """
+    return "\n".join(help_lines(cmd, timeout))
+
+def help_lines(cmd, timeout=None):
+    """
+    help_output's lines as cmd writes them, so they can be parsed while it's
+    still going. a thread keeps the pipe drained, up to help_buffer chunks
+    ahead, so cmd isn't held up by a full pipe while they're parsed.
+    the probe is stopped if they aren't all read.
+    """
+    import locale
+    import queue
+    import shlex
+    import threading
+    import clpy.__cli__ as cli
+    try:
+        proc = subprocess.Popen([*shlex.split(cmd), "--help"], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, **cli.group_options(True))
+    except OSError as e:
+        yield str(e)
+        return
+    chunks = queue.Queue(help_buffer)
+    def pump():
+        try:
+            while chunk := proc.stdout.read1(1 << 16): chunks.put(chunk)
+        finally:
+            chunks.put(b"")
+    threading.Thread(target=pump, daemon=True).start()
+    encoding = locale.getpreferredencoding(False)
+    timer = threading.Timer(timeout, cli.stop, (proc, 0)) if timeout else None
+    if timer: timer.start()
+    chunk, pending = True, b""
+    try:
+        while chunk := chunks.get():
+            # whole lines are decoded a chunk at a time, the rest waits for the next.
+            data = pending+chunk
+            end = data.rfind(b"\n")+1
+            if end:
+                yield from cli.decode(data[:end], encoding, "replace").removesuffix("\n").split("\n")
+            pending = data[end:]
+        if pending: yield from cli.decode(pending, encoding, "replace").removesuffix("\n").split("\n")
+    finally:
+        if timer: timer.cancel()
+        if proc.poll() is None: cli.stop(proc, 0)
+        # let the reader run to EOF.
+        while chunk: chunk = chunks.get()
+        proc.stdout.close()
+        proc.wait()
+
+def read_source(cmd, source="auto"):
+    """
+    the lines generate parses for cmd and whether they're a man page.
+    "man" renders its man page from MANPATH, "help" runs cmd --help,
+    "auto" tries the man page first. --help lines come as cmd prints them.
+    """
+    if source != "help":
+        from clpy.__man__ import man_text
+        if text := man_text(cmd): return text, True
+        if source == "man": return [], True
+    return help_lines(cmd, probe_timeout), False
+
+# the usage is looked for in this many lines, and a man page's NAME heading.
+head_lines = 32
+
+def parse_text(help_text, keep_lines=True):
+    """
+    parses --help output or a man page, a list or any iterable of lines.
+    returns the usage, the options and for --help, the prologue and any unused
+    lines if keep_lines, see scan_help.
+    --help output is parsed as it's read, holding on to no more than the first
+    head_lines lines and the option being parsed. man pages are parsed whole.
+    """
+    lines = iter(help_text)
+    head = list(itertools.islice(lines, head_lines))
+    if "NAME" in head:
+        help_text = [*head, *lines]
+        if "SYNOPSIS" in help_text and "DESCRIPTION" in help_text:
+            context = ParseContext([m for l in help_text for m in reg.g_flag.findall(l)])
+            usage, options = parse_man(help_text, context=context)
+            return usage, options, [], []
+        lines = iter(help_text[len(head):])
+
+    # validation needs every flag-like word, they're picked up on the way past.
+    flags = set()
+    def scanned(lines):
+        for line in lines:
+            flags.update(reg.g_flag.findall(line))
+            yield line
+
+    usage, _, start = parse_usage(head)
+    flags.update([m for l in head[:start] for m in reg.g_flag.findall(l)])
+    rest = scanned(itertools.chain(head[start:], lines))
+    prologue, unused, options = scan_help(rest, start, keep_lines=keep_lines)
+    validate_options(options, ParseContext(flags))
+    return usage, options, prologue, unused
+
+def generate(cmd, defaults=None, debug=False, cacheable=False, decoder=None, update=True, force=False, source="auto"):
+    """
+    generates cmd's module, returns a summary of what was parsed: where from,
+    how many options were kept and how many were bad matches or only salvaged.
+    """
+    key = fingerprint(cmd, defaults, cacheable, decoder, source) if not debug else None
+    if key and not force and (summary := is_generated(cmd, key)):
+        if update: update_cli()
+        return summary
+    def parsed(source):
+        # only debugging needs the text kept, otherwise it's parsed as it comes.
+        help_text, from_man = read_source(cmd, source)
+        if debug: help_text = list(help_text)
+        return help_text, from_man, *parse_text(help_text, keep_lines=debug)
+
+    help_text, from_man, usage, options, prologue, unused = parsed(source)
+    if from_man and usage:
+        # the page was looked up by name, that's more reliable than its synopsis.
+        usage.cmd = cmd.split()
+    if from_man and source == "auto" and not (usage and options):
+        help_text, from_man, usage, options, prologue, unused = parsed("help")
+
+    if debug:
+        is_man_page = "NAME" in help_text and "SYNOPSIS" in help_text
+        debug_print(prologue, unused, options, usage, "man" if is_man_page else "help", True, False)
+        open(os.path.join(clpydir, "debug_help.txt"), "w").write("\n".join(help_text))
+        return None
+    files = generate_module(usage, options, defaults, cacheable, decoder, source)
+    summary = {
+        "source": "man" if from_man else "help",
+        "usage": bool(usage),
+        "options": len(option_table(options)[1]) if usage and options else 0,
+        "bad_matches": sum([1 for o in options if o.bad_match]),
+        "salvaged": sum([1 for o in options if not o.bad_match and o.doc and o.doc[0].startswith("Warning:")]),
+    }
+    if key and files:
+        os.makedirs(os.path.dirname(fingerprint_path(cmd)), exist_ok=True)
+        write_if_changed(fingerprint_path(cmd), json.dumps({"key": key, "files": files, "summary": summary}))
+    if update: update_cli()
+    return {**summary, "files": files}
+
+    
+def option_table(options):
+    """
+    filters out bad options etc, returns the positionals, the flag options
+    and the option dict generated modules are built with.
+    """
+    positional = [o for o in options if not o.bad_match and o.is_positional]
+    options = [o for o in options if not o.bad_match and not o.is_positional]
+    options_dict = {}
+    for o in options:
+        if o.name not in options_dict:
+            options_dict[o.name] = o
+    options = [o for o in options_dict.values()]
+    # same as merging each into the last with {**new, **old}, without the copies:
+    # the first option to use a name keeps it, the last option's names come first.
+    option_dict = {}
+    for o in reversed(options): option_dict.update(o.to_dict())
+    return positional, options, option_dict
+
+def generate_module(usage, options, defaults, cacheable=False, decoder=None, source="auto"):
+    if not usage or not options:
+        return []
+        
+    positional, options, option_dict = option_table(options)
+    if not options:
+        # an empty flags enum wouldn't even import.
+        return []
+
+    cmd = "_".join(usage.cmd)
+    usage_cmd = usage.cmd
+    pycmd = cmd.replace("+", "p").replace("-", "_")
+
+    # Options are written into the module as a literal, one per line,
+    # so they load from the .pyc with everything else.
+    options_str = "{\n"+"".join([f"{''.ljust(8)}{k!r}: {v!r},\n" for k, v in option_dict.items()])+"".ljust(4)+"}"
+
+    length = 64
+    tab = 4
+    
+    usage = ("\n").join(["".ljust(tab)+u[1] for u in [*usage.lines, (None,"")]])+"\n"
+    if len(positional) < 20:
+        docargs = options_str_list(positional, tab, length)
+        if docargs:
+            docargs = ["Positional arguments:",
+                       "".ljust(length, "-"),
+                        *docargs, "\n"]
+            docargs = "".ljust(tab)+"\n".ljust(tab+1).join(docargs)
+        else: docargs = ""
+    else:
+        docargs = "long_args"
+
+    if len(options) < 20:
+        docflags = options_str_list(options, tab, length)
+        docflags2 = ""
+        if docflags:
+            docflags = ["All available flags:",
+                        "".ljust(length, "-"),
+                        *docflags, ""]
+            docflags2 = docflags
+            docflags = "".ljust(tab)+"\n".ljust(tab+1).join(docflags)
+            docflags2 = "".ljust(tab*2)+"\n".ljust((tab*2)+1).join(docflags2)
+        else: docflags = ""
+    else:
+        docflags = "".ljust(tab)+f"see {pycmd}.flags for all {len(options)} options."
+        docflags2 = "".ljust(tab*2)+f"see {pycmd}.flags for all {len(options)} options."
+    
+    # Generate enums
+    if docflags:
+        enums = []
+        enums.extend([
+            (
+                *["# "+d for d in o.doc],
+                "# usage: func("+(f"({pycmd}.{flag_name}.{o.name}, {o.nargs})" if o.nargs else f"{pycmd}.{flag_name}.{o.name}")+")",
+                *[f"{d.name} = auto()" for d in [o, *[c for c in o.children if not c.bad_match]]]
+            ) for o in options if o.is_parent
+        ])
+        
+        enums = ["\n"+"\n".ljust(5).join(("", *a)) for a in enums]
+        enums[0] = "".ljust(4)+enums[0].lstrip()
+        enums = "".join(enums)
+    else: enums = ""
+
+    g_flags = defaults if defaults else []
+    init = class_fmt.format(
+        pycmd=pycmd,
+        cmd=cmd,
+        usage_cmd=usage_cmd,
+        usage=usage,
+        docflags=docflags,
+        docargs=docargs,
+        enum=enums,
+        g_flags=g_flags,
+        options=options_str,
+        cacheable=cacheable,
+        decoder=decoder,
+        source=source,
+        f=flag_name,
+        docflags2=docflags2
+    )
+    os.makedirs(clidir, exist_ok=True)
+    # options used to live in a pickle next to the module.
+    if os.path.exists(old := os.path.join(clidir, f"{pycmd}_options.pkl")):
+        os.remove(old)
+    return [write_if_changed(os.path.join(clidir, f"{pycmd}.py"), init)]
+
+def update_cli():
+    # generated modules are found by clpy's import hook now, this clears out
+    # the clpy/<module>.py shims older versions wrote for them.
+    clibasename = os.path.basename(clidir)
+    modules = os.listdir(clidir)
+    modules = [m[:-3] for m in modules if m.endswith(".py") and not m == "__init__.py"]
+    for m in modules:
+        shim = os.path.join(clpydir, f"{m}.py")
+        if os.path.exists(shim):
+            with open(shim) as f:
+                is_shim = f.read().startswith(f"from clpy.{clibasename}.{m} import ")
+            if is_shim: os.remove(shim)
+
+def regenerate_module(module, force=False):
+    # runs in a worker process, the shims are left for __regenerate_all__ to update.
+    start = time.perf_counter()
+    try:
+        module = importlib.import_module(f"clpy.{os.path.basename(clidir)}.{module}")
+        module.runner().__regenerate__(update=False, force=force)
+        return None, time.perf_counter()-start
+    except Exception as e:
+        return f"{type(e).__name__}: {e}", time.perf_counter()-start
+
+def __regenerate_all__(jobs=None, force=False):
+    modules = os.listdir(clidir)
+    modules = [m[:-3] for m in modules if m.endswith(".py") and not m == "__init__.py"]
+    modules = sorted(modules)
+    with concurrent.futures.ProcessPoolExecutor(jobs if jobs else os.cpu_count()) as pool:
+        results = list(pool.map(regenerate_module, modules, [force]*len(modules)))
+    update_cli()
+
+    failed = 0
+    for m, (error, seconds) in zip(modules, results):
+        print(f"{'failed' if error else 'ok':<8}{m:<24}{seconds:.2f}s"+(f"  {error}" if error else ""))
+        failed += 1 if error else 0
+    print(f"regenerated {len(modules)-failed}/{len(modules)} modules, {failed} failed.")
+
+def read_manifest(path):
+    # one command per line, blank lines and #comments ignored.
+    with open(path) as f:
+        lines = [l.split("#")[0].strip() for l in f]
+    return [l for l in lines if l]
+
+def path_commands(patterns=["*"]):
+    """
+    the names of the executables on PATH matching any of patterns, skipping the
+    ones that can't be module names.
+    """
+    names = set()
+    for d in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        try:
+            entries = os.scandir(d if d else ".")
+        except OSError:
+            continue
+        with entries:
+            for e in entries:
+                if e.name in names or not any(fnmatch.fnmatchcase(e.name, p) for p in patterns): continue
+                if not e.name.replace("+", "p").replace("-", "_").isidentifier(): continue
+                if e.is_file() and os.access(e.path, os.X_OK):
+                    names.add(e.name)
+    return sorted(names)
+
+def generate_one(cmd, settings):
+    # runs in a worker process, returns the report entry for cmd.
+    start = time.perf_counter()
+    entry = {"command": cmd}
+    try:
+        # the parser's warnings would drown out the report.
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = generate(cmd, update=False, **settings)
+        entry.update(summary)
+        if not summary["files"] or not summary["options"]:
+            entry["status"] = "failed"
+            entry["error"] = "no flags found" if summary["usage"] else "no usage found"
+        elif summary["bad_matches"] or summary["salvaged"]:
+            entry["status"] = "partial"
+        else:
+            entry["status"] = "clean"
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["seconds"] = round(time.perf_counter()-start, 3)
+    return entry
+
+def generate_many(cmds, jobs=None, report=None, **settings):
+    """
+    generates many commands' modules at once, jobs processes at a time, then
+    updates clpy once. prints a line per command and writes the entries to
+    report as json if given, returns them.
+    entries have a status of "clean", "partial" (some options were bad matches
+    or salvaged) or "failed", along with generate's summary or the error.
+    """
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(jobs if jobs else os.cpu_count()) as pool:
+        entries = list(pool.map(generate_one, cmds, [settings]*len(cmds), chunksize=4))
+    update_cli()
+
+    counts = {"clean": 0, "partial": 0, "failed": 0}
+    for e in entries:
+        counts[e["status"]] += 1
+        detail = e["error"] if "error" in e else f"{e['options']} options from {e['source']}"+(" (up to date)" if e.get("up_to_date") else "")
+        print(f"{e['status']:<8}{e['command']:<24}{e['seconds']:.2f}s  {detail}")
+    print(f"generated {len(entries)} commands in {time.perf_counter()-start:.1f}s, "+", ".join([f"{v} {k}" for k, v in counts.items()])+".")
+    if report:
+        with open(report, "w") as f:
+            json.dump({"counts": counts, "commands": entries}, f, indent=1)
+            f.write("\n")
+    return entries
+
+if __name__ == "__main__":
+    main()
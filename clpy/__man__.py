@@ -0,0 +1,248 @@
+import os
+import re
+
+# finds man pages on MANPATH and renders their roff to text for parse_man,
+# without spawning man or the command.
+
+sections = ["1", "8", "6"]
+compressed = {
+    "": lambda path: open(path, "rb"),
+    ".gz": lambda path: __import__("gzip").open(path, "rb"),
+    ".xz": lambda path: __import__("lzma").open(path, "rb"),
+    ".bz2": lambda path: __import__("bz2").open(path, "rb"),
+}
+# the default width of a tagged paragraph's indent, like man uses.
+tab = 7
+
+class reg:
+    request = re.compile(r"^[.'][ \t]*(\S*)[ \t]*(.*)$")
+    arg = re.compile(r'"((?:[^"]|"")*)"?|(\S+)')
+    escape = re.compile(
+        r"\\(?:"
+        r'(?P<comment>".*)'
+        r"|[fF](?:\[[^\]]*\]|\(..|.)"
+        r"|s(?:[-+]?\d|\[[^\]]*\]|\(..)"
+        r"|n[-+]?(?:\[[^\]]*\]|\(..|.)"
+        r"|\*(?:\[(?P<string>[^\]]*)\]|\((?P<string2>..)|(?P<string1>.))"
+        r"|\[(?P<glyph>[^\]]*)\]|\((?P<glyph2>..)"
+        r"|[hvwoLlXbDZNkmMuYVRgxH]'[^']*'|[hvwoLlXbDZNkmMuYVRgxH]\[[^\]]*\]"
+        r"|(?P<char>.?)"
+        r")"
+    )
+    mdoc = re.compile(r"^\.(Dd|Sh|Nm)\b", re.M)
+
+glyphs = {
+    "-": "-", "hy": "-", "mi": "-", "en": "-", "em": "--", "aq": "'", "dq": '"',
+    "lq": '"', "rq": '"', "oq": "'", "cq": "'", "bu": "*", "ti": "~", "ha": "^",
+    "rs": "\\", "sl": "/", "co": "(C)", "rg": "(R)", "tm": "(TM)", "Fo": "<<",
+    "Fc": ">>", "<=": "<=", ">=": ">=", "mu": "x", "pl": "+", "eq": "=", "de": "deg",
+    "ba": "|", "or": "|", "at": "@", "sh": "#", "Do": "$", "lB": "[", "rB": "]",
+    "lC": "{", "rC": "}", "la": "<", "ra": ">", "ga": "`", "aa": "'", "ua": "^",
+}
+chars = {
+    "-": "-", "e": "\\", "\\": "\\", " ": " ", "~": " ", "0": " ", "t": " ",
+    "'": "'", "`": "`", ".": ".", "&": "", "|": "", "^": "", ",": "", "/": "",
+    ":": "", "%": "", "c": "", "d": "", "u": "", "!": "", "p": "", "r": "", "a": "",
+    "z": "", "{": "", "}": "", "": "",
+}
+
+def text(line):
+    # roff escapes to plain text.
+    def sub(m):
+        if m.group("comment") is not None: return ""
+        name = m.group("glyph") or m.group("glyph2") or m.group("string") or m.group("string2") or m.group("string1")
+        if name is not None: return glyphs.get(name, "")
+        char = m.group("char")
+        if char is not None: return chars.get(char, char)
+        return ""
+    return reg.escape.sub(sub, line)
+
+def arguments(args):
+    return [m.group(1).replace('""', '"') if m.group(1) is not None else m.group(2) for m in reg.arg.finditer(args)]
+
+def width(arg, default=tab):
+    m = re.match(r"\d+", arg) if arg else None
+    return int(m.group()) if m else default
+
+def manpath():
+    """
+    directories man pages are looked for in, MANPATH if it's set, else the man
+    directories next to each PATH entry and the usual system ones.
+    an empty MANPATH entry stands for the defaults, like man's.
+    """
+    defaults = []
+    for d in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        if d:
+            d = os.path.dirname(d.rstrip(os.sep))
+            defaults.extend([os.path.join(d, "share", "man"), os.path.join(d, "man")])
+    defaults.extend(["/usr/local/share/man", "/usr/share/man", "/usr/local/man", "/usr/man"])
+    env = os.environ.get("MANPATH")
+    dirs = [p for e in env.split(":") for p in ([e] if e else defaults)] if env else defaults
+    return [d for d in dict.fromkeys(dirs) if os.path.isdir(d)]
+
+def find(name, dirs=None):
+    """
+    the path of name's man page, plain or compressed, None if there isn't one.
+    """
+    for d in dirs if dirs is not None else manpath():
+        for section in sections:
+            for ext in compressed:
+                path = os.path.join(d, f"man{section}", f"{name}.{section}{ext}")
+                if os.path.isfile(path): return path
+    return None
+
+def read(path, depth=0):
+    """
+    a man page's roff source, following .so links to other pages.
+    """
+    ext = os.path.splitext(path)[1]
+    with compressed[ext if ext in compressed else ""](path) as f:
+        roff = f.read().decode("utf-8", "replace")
+    if depth < 4 and (m := re.match(r"\s*\.so\s+(\S+)", roff)):
+        root = os.path.dirname(os.path.dirname(path))
+        for ext in compressed:
+            if os.path.isfile(linked := os.path.join(root, m.group(1)+ext)):
+                return read(linked, depth+1)
+    return roff
+
+class renderer:
+    """
+    lays man(7) roff out as text, like `man -P cat` without the line wrapping:
+    headings at column 0, paragraphs indented 7, tagged paragraph bodies 7 more.
+    each filled paragraph comes out as one line.
+    """
+    def __init__(self):
+        self.lines = []
+        self.words = []
+        self.base = tab
+        self.indent = tab
+        self.stack = []
+        self.fill = True
+        self.tag = None
+        self.tag_next = False
+        self.heading_next = None
+        self.skip = None
+        pass
+
+    def flush(self):
+        body = " ".join(self.words).strip()
+        self.words = []
+        if self.tag is not None:
+            tag, self.tag = self.tag, None
+            if body and len(tag) < self.indent - self.base:
+                self.lines.append("".ljust(self.base)+tag.ljust(self.indent-self.base)+body)
+                return
+            self.lines.append("".ljust(self.base)+tag)
+        if body: self.lines.append("".ljust(self.indent)+body)
+        pass
+
+    def blank(self):
+        self.flush()
+        # not straight after a heading, like man.
+        if self.lines and self.lines[-1].startswith(" "): self.lines.append("")
+        pass
+
+    def add(self, words):
+        if self.heading_next:
+            self.heading(self.heading_next, words)
+        elif self.tag_next:
+            self.tag_next = False
+            self.tag = words
+        else:
+            self.words.append(words)
+            if not self.fill: self.flush()
+        pass
+
+    def heading(self, kind, title):
+        self.heading_next = None
+        self.blank()
+        self.base = self.indent = tab
+        self.stack = []
+        self.lines.append(title.upper() if kind == "SH" else "   "+title)
+        pass
+
+    def request(self, name, args):
+        arg = arguments(args)
+        if name in ["SH", "SS"]:
+            if arg: self.heading(name, text(" ".join(arg)))
+            else: self.heading_next = name
+        elif name in ["PP", "P", "LP"]:
+            self.blank()
+            self.indent = self.base
+        elif name == "TP":
+            self.blank()
+            self.indent = self.base + width(arg[0] if arg else None)
+            self.tag_next = True
+        elif name == "IP":
+            self.blank()
+            self.indent = self.base + width(arg[1] if len(arg) > 1 else None)
+            if arg and arg[0]: self.tag = text(arg[0])
+        elif name == "HP":
+            self.blank()
+            self.indent = self.base
+        elif name == "RS":
+            self.flush()
+            self.stack.append(self.base)
+            self.base = self.indent = self.base + width(arg[0] if arg else None)
+        elif name == "RE":
+            self.flush()
+            self.base = self.indent = self.stack.pop() if self.stack else tab
+        elif name in ["br", "sp"]:
+            if name == "sp": self.blank()
+            else: self.flush()
+        elif name in ["nf", "EX"]:
+            self.flush()
+            self.fill = False
+        elif name in ["fi", "EE"]:
+            self.flush()
+            self.fill = True
+        elif name in ["B", "I", "SM", "SB"]:
+            if arg: self.add(text(" ".join(arg)))
+        elif name in ["BR", "BI", "IB", "IR", "RB", "RI"]:
+            if arg: self.add(text("".join(arg)))
+        elif name == "OP":
+            if arg: self.add("["+text(" ".join(arg))+"]")
+        elif name == "SY":
+            self.blank()
+            if arg: self.add(text(" ".join(arg)))
+        elif name in ["UE", "ME"]:
+            if arg: self.words[-1:] = ["".join([*self.words[-1:], text(arg[0])])]
+        elif name == "TS":
+            self.skip = "TE"
+        elif name in ["de", "de1", "am", "ig"]:
+            self.skip = ".."
+        elif name in ["if", "ie", "el"]:
+            if "\\{" in args: self.skip = "\\}"
+        # anything else (TH, ft, ad, ne, PD, UR...) doesn't change the text.
+        pass
+
+    def render(self, roff):
+        for line in roff.split("\n"):
+            if self.skip:
+                if self.skip in line or (self.skip != "\\}" and line.startswith("."+self.skip)): self.skip = None
+                continue
+            if m := reg.request.match(line):
+                self.request(m.group(1), m.group(2))
+            elif not line.strip():
+                self.blank()
+            else:
+                self.add(text(line))
+        self.flush()
+        return self.lines
+
+def render(roff):
+    """
+    a man(7) page's roff as a list of text lines, see renderer.
+    """
+    return renderer().render(roff)
+
+def man_text(cmd, dirs=None):
+    """
+    cmd's man page as text lines for parse_man, subcommands like "git commit"
+    are looked up as git-commit. None if there's no page, or it's an mdoc page.
+    """
+    path = find("-".join(cmd.split()), dirs)
+    if not path: return None
+    roff = read(path)
+    if reg.mdoc.search(roff): return None
+    return render(roff)